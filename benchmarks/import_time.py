@@ -0,0 +1,70 @@
+"""Cold import time of an inference-only worker versus the old monolithic main.py import set.
+
+Every measurement runs in a fresh interpreter, so nothing is shared through sys.modules:
+
+    python benchmarks/import_time.py --repeats 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module-level imports of main.py before the package split (NLTK downloads and the dataset load came on top)
+MONOLITHIC_IMPORTS = """
+import torch
+from transformers import T5ForConditionalGeneration, T5Tokenizer, Trainer, TrainingArguments
+from datasets import load_dataset
+from rouge import Rouge
+import nltk
+import gradio
+import matplotlib.pyplot
+import pandas
+from torch.utils.tensorboard import SummaryWriter
+"""
+
+INFERENCE_IMPORTS = """
+from textsummarization.models import load_our_model
+from textsummarization.summarization import generate_summary
+"""
+
+HEAVY_MODULES = ("datasets", "gradio", "matplotlib", "nltk", "pandas", "rouge", "torch.utils.tensorboard")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+exec(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(statement, repeats):
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", PROBE.format(heavy=HEAVY_MODULES), statement],
+                                cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {"median_seconds": statistics.median(run["seconds"] for run in runs), "heavy_modules_loaded": runs[-1]["loaded"]}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = {
+        "monolithic": measure(MONOLITHIC_IMPORTS, args.repeats),
+        "inference_only": measure(INFERENCE_IMPORTS, args.repeats),
+    }
+    results["speedup"] = results["monolithic"]["median_seconds"] / results["inference_only"]["median_seconds"]
+
+    for name in ("monolithic", "inference_only"):
+        print(f"{name:15s} {results[name]['median_seconds']:.2f}s  heavy modules: {results[name]['heavy_modules_loaded']}")
+    print(f"inference-only worker imports {results['speedup']:.1f}x faster")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Offline benchmarks of preprocessing, training steps, generation and ROUGE on a tiny synthetic setup.
+
+Nothing is downloaded: the model is a randomly initialized T5Config, the tokenizer is a SentencePiece model
+trained at startup on a seeded, CNN/DailyMail-shaped synthetic corpus. Only the preprocessing benchmark needs the
+NLTK data to be installed already, and is skipped otherwise.
+
+    python benchmarks/suite.py --output bench.json
+    python benchmarks/suite.py --output new.json --compare bench.json --threshold 0.1
+    python benchmarks/suite.py --check   # ROUGE parity with the rouge package, no timing
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+SEED = 0
+
+# Random T5 with the t5-small layout scaled down, so a run takes seconds on one CPU
+TINY_T5 = dict(d_model=64, d_ff=128, d_kv=16, num_heads=4, num_layers=2, num_decoder_layers=2)
+
+WORDS = ("government officials said police report city president company people year week market court election "
+         "minister health school water energy billion million percent team season player coach fans game win loss "
+         "storm weather flood fire rescue hospital patients study researchers found new first last former national "
+         "international local village family children home told reporters statement monday tuesday friday").split()
+
+def synthetic_corpus(num_articles, seed=SEED):
+    # Articles of 20-40 sentences with 3-4 sentence highlights, roughly the CNN/DailyMail shape
+    rng = random.Random(seed)
+
+    def sentence():
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 24))]
+        return " ".join(words).capitalize() + "."
+
+    corpus = []
+    for i in range(num_articles):
+        article = " ".join(sentence() for _ in range(rng.randint(20, 40)))
+        highlights = " ".join(sentence() for _ in range(rng.randint(3, 4)))
+        corpus.append({"id": str(i), "article": article, "highlights": highlights})
+    return corpus
+
+def build_tokenizer(corpus, fixture_dir, vocab_size=1000):
+    import sentencepiece as spm
+    from transformers import T5Tokenizer
+
+    # Same special ids as t5-small: pad 0, eos 1, unk 2, no bos; the synthetic corpus has under a hundred distinct
+    # words, so vocab_size is an upper bound rather than a requirement
+    model_prefix = os.path.join(fixture_dir, "spiece")
+    spm.SentencePieceTrainer.train(
+        sentence_iterator=iter(text for example in corpus for text in (example["article"], example["highlights"])),
+        model_prefix=model_prefix, vocab_size=vocab_size, hard_vocab_limit=False, model_type="unigram", pad_id=0,
+        eos_id=1, unk_id=2, bos_id=-1, minloglevel=2,
+    )
+    tokenizer = T5Tokenizer(model_prefix + ".model", extra_ids=0)
+    tokenizer.save_pretrained(fixture_dir)
+    return tokenizer
+
+def build_model(tokenizer):
+    import torch
+    from transformers import T5Config, T5ForConditionalGeneration
+
+    torch.manual_seed(SEED)
+    config = T5Config(vocab_size=len(tokenizer), decoder_start_token_id=tokenizer.pad_token_id,
+                      pad_token_id=tokenizer.pad_token_id, eos_token_id=tokenizer.eos_token_id, **TINY_T5)
+    return T5ForConditionalGeneration(config).eval()
+
+def timed(function, repeats):
+    # Median of repeats after one untimed warm-up run
+    function()
+    runs = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start_time)
+    return statistics.median(runs)
+
+def metric(value, unit, higher_is_better=True):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+def bench_preprocessing(corpus, fixture_dir, repeats, num_workers):
+    import nltk
+
+    from textsummarization import preprocessing
+
+    for resource in preprocessing.NLTK_RESOURCES.values():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            print(f"preprocessing: skipped, NLTK resource {resource} is not installed")
+            return {}
+
+    # The fixture tokenizer stands in for t5-small in every preprocessing path, including forked workers
+    preprocessing.PREPROCESSING_TOKENIZER = fixture_dir
+    preprocessing.get_preprocessing_tokenizer.cache_clear()
+    seconds = timed(lambda: preprocessing.preprocess_dataset(corpus, num_workers=num_workers), repeats)
+    return {"preprocessing.articles_per_sec": metric(len(corpus) / seconds, "articles/sec")}
+
+def tokenize_corpus(corpus, tokenizer, max_seq_length=512):
+    features = []
+    for example in corpus:
+        features.append({
+            "input_ids": tokenizer.encode(example["article"], truncation=True, max_length=max_seq_length),
+            "labels": tokenizer.encode(example["highlights"], truncation=True, max_length=max_seq_length),
+        })
+    return features
+
+def bench_training_step(corpus, tokenizer, fixture_dir, repeats, max_tokens_per_batch, num_steps=10):
+    import torch
+
+    from textsummarization.shards import Seq2SeqShardCollator, TokenShardDataset, save_token_shard
+    from textsummarization.training import LengthBucketBatchSampler
+
+    prefix = os.path.join(fixture_dir, "train")
+    save_token_shard(tokenize_corpus(corpus, tokenizer), prefix)
+    dataset = TokenShardDataset(prefix)
+    collator = Seq2SeqShardCollator(pad_token_id=tokenizer.pad_token_id)
+    sampler = LengthBucketBatchSampler(dataset.source_lengths(), max_tokens_per_batch, seed=SEED)
+    batches = [collator([dataset[i] for i in batch]) for batch in list(iter(sampler))[:num_steps]]
+
+    # Forward, backward and optimizer step as in BucketedSeq2SeqTrainer, without the Trainer bookkeeping
+    model = build_model(tokenizer).train()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=5e-5)
+
+    def run():
+        for batch in batches:
+            loss = model(**batch).loss
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+
+    seconds = timed(run, repeats)
+    num_samples = sum(len(batch["input_ids"]) for batch in batches)
+    return {
+        "training.samples_per_sec": metric(num_samples / seconds, "samples/sec"),
+        "training.seconds_per_step": metric(seconds / len(batches), "s/step", higher_is_better=False),
+    }
+
+def bench_generation(corpus, tokenizer, repeats, batch_sizes, beam_widths, max_length=32):
+    from textsummarization.summarization import generate_summaries
+
+    model = build_model(tokenizer)
+    results = {}
+    for num_beams in beam_widths:
+        for batch_size in batch_sizes:
+            texts = [example["article"] for example in corpus[:batch_size * 2]]
+            seconds = timed(lambda: generate_summaries(model, tokenizer, texts, batch_size=batch_size,
+                                                       max_length=max_length, num_beams=num_beams), repeats)
+            name = f"generation.beams{num_beams}.batch{batch_size}"
+            # The corpus may hold fewer than two full batches
+            num_batches = math.ceil(len(texts) / batch_size)
+            results[f"{name}.latency_ms"] = metric(seconds / num_batches * 1000, "ms/batch", higher_is_better=False)
+            results[f"{name}.docs_per_sec"] = metric(len(texts) / seconds, "docs/sec")
+    return results
+
+def bench_rouge(corpus, repeats, num_workers):
+    from textsummarization.evaluation import rouge_scores
+
+    # Highlights of the next article as the "prediction" gives realistic, partially overlapping pairs
+    references = [example["highlights"] for example in corpus]
+    predictions = references[1:] + references[:1]
+    seconds = timed(lambda: rouge_scores(predictions, references, num_workers=num_workers), repeats)
+    return {"rouge.pairs_per_sec": metric(len(references) / seconds, "pairs/sec")}
+
+# Pairs the built-in ROUGE must score exactly like rouge.Rouge: punctuation, case, repeated words, several sentences
+ROUGE_CHECK_PAIRS = [
+    ("the cat sat on the mat", "the cat sat on the mat"),
+    ("The Cat sat on the mat.", "the cat sat on the mat"),
+    ("the the the cat", "the cat the cat the cat"),
+    ("police said, on monday, that the man was arrested.", "the man was arrested on monday, police said."),
+    ("Shares rose 3.5 percent. The market closed higher.", "The market closed higher. Shares rose 3.5 percent!"),
+    ("a b a b a b. b a b a.", "a b. a b. a b a b"),
+    ("  extra   spaces \n and\ttabs . here ", "extra spaces and tabs. here"),
+    ("... dots ... everywhere ...", "dots everywhere"),
+    ("U.S. officials met in Washington D.C. on Friday.", "US officials met in Washington DC on Friday"),
+    ("completely different words", "nothing in common here"),
+    ("single", "single"),
+    ("word word word word", "word"),
+]
+
+def check_rouge(num_articles, num_workers):
+    # Per pair and averaged, on the fixed pairs plus the benchmark's synthetic highlights
+    from rouge import Rouge
+
+    from textsummarization.evaluation import ROUGE_METRICS, rouge_pair_scores, rouge_scores
+
+    references = [example["highlights"] for example in synthetic_corpus(num_articles)]
+    pairs = ROUGE_CHECK_PAIRS + list(zip(references[1:] + references[:1], references))
+    predictions, references = zip(*pairs)
+    expected = Rouge().get_scores(list(predictions), list(references))
+    expected_average = Rouge().get_scores(list(predictions), list(references), avg=True)
+
+    def mismatches(label, actual, wanted):
+        return [f"{label} {metric}.{key}: {actual[metric][key]!r} != {wanted[metric][key]!r}"
+                for metric in ROUGE_METRICS for key in ("f", "p", "r")
+                if abs(actual[metric][key] - wanted[metric][key]) > 1e-9]
+
+    failures = []
+    for (prediction, reference), wanted in zip(pairs, expected):
+        failures += mismatches(repr((prediction, reference)), rouge_pair_scores(prediction, reference), wanted)
+    failures += mismatches("average", rouge_scores(predictions, references, num_workers=num_workers), expected_average)
+    for failure in failures:
+        print(failure)
+    print(f"ROUGE parity: {len(pairs)} pairs, {len(failures)} mismatch(es)")
+    return failures
+
+def run_suite(args):
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    corpus = synthetic_corpus(args.num_articles)
+    results = {}
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        tokenizer = build_tokenizer(corpus, fixture_dir)
+        results.update(bench_preprocessing(corpus, fixture_dir, args.repeats, args.num_workers))
+        results.update(bench_training_step(corpus, tokenizer, fixture_dir, args.repeats, args.max_tokens_per_batch))
+        results.update(bench_generation(corpus, tokenizer, args.repeats, args.batch_sizes, args.beam_widths))
+        results.update(bench_rouge(corpus * 10, args.repeats, args.num_workers))
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpu_count": os.cpu_count(),
+            "threads": torch.get_num_threads(),
+            "num_articles": args.num_articles,
+            "repeats": args.repeats,
+            "seed": SEED,
+        },
+        "results": results,
+    }
+
+def compare(results, baseline, threshold):
+    # A metric regresses when it is worse than the baseline by more than threshold (relative)
+    regressions = []
+    for name, current in sorted(results["results"].items()):
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print(f"{name:45s} {current['value']:12.2f} {current['unit']:10s} (new)")
+            continue
+        change = current["value"] / previous["value"] - 1 if previous["value"] else 0.0
+        worse = -change if current["higher_is_better"] else change
+        flag = "REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:45s} {current['value']:12.2f} {current['unit']:10s} {change:+7.1%} {flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench.json", help="Where to write the results JSON")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--check", action="store_true",
+                        help="Only compare the built-in ROUGE against the rouge package; exits 1 on a mismatch")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--num_articles", type=int, default=64)
+    parser.add_argument("--num_workers", type=int, default=2, help="Preprocessing and ROUGE worker processes")
+    parser.add_argument("--threads", type=int, default=1, help="torch threads; fixed so runs are comparable")
+    parser.add_argument("--max_tokens_per_batch", type=int, default=4096)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--beam_widths", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args(argv)
+
+    if args.check:
+        if check_rouge(args.num_articles, args.num_workers):
+            sys.exit(1)
+        return None
+
+    results = run_suite(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        for name, value in sorted(results["results"].items()):
+            print(f"{name:45s} {value['value']:12.2f} {value['unit']}")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -14,495 +14,55 @@ Original file is located at
 !pip install accelerate -U
 !pip install rouge
 
-import torch
-import os
-import json
-from transformers import T5ForConditionalGeneration, T5Tokenizer, T5Config
-from datasets import load_dataset
-from transformers import TextDataset, DataCollatorForLanguageModeling
-from transformers import Trainer, TrainingArguments
-from rouge import Rouge
-import nltk
-import gradio as gr
-import matplotlib.pyplot as plt
-from torch.utils.tensorboard import SummaryWriter
-from transformers import AdamW
-from transformers import get_scheduler
-from transformers import EarlyStoppingCallback
-from transformers.optimization import AdamW, get_linear_schedule_with_warmup
-
-from nltk.corpus import stopwords
-from nltk import pos_tag
-from nltk.tokenize import word_tokenize
-from nltk.corpus import wordnet
-
-nltk.download("stopwords")
-nltk.download("punkt")
-nltk.download("wordnet")
-nltk.download('averaged_perceptron_tagger')
-
-"""**Loading CNN-DailyMail Dataset**"""
-
-# Step 1: Load the CNN/Daily Mail dataset using load_dataset
-cnn_daily_mail = load_dataset("cnn_dailymail",'3.0.0')
-
-# Access the training split
-train_dataset = cnn_daily_mail["train"]
-
-# Access the validation split
-validation_dataset = cnn_daily_mail["validation"]
+"""**Importing the Summarization Package**"""
 
-# Access the test split
-test_dataset = cnn_daily_mail["test"]
-
-"""**Preprocessing For Dataset**"""
-
-# Step 2: Preprocess the data according to t5 model for abstractive text summarization
-tokenizer = T5Tokenizer.from_pretrained("t5-small")
-
-tokenizer.pad_token = tokenizer.eos_token
-
-def get_wordnet_pos(treebank_tag):
-    if treebank_tag.startswith('J'):
-        return wordnet.ADJ
-    elif treebank_tag.startswith('V'):
-        return wordnet.VERB
-    elif treebank_tag.startswith('N'):
-        return wordnet.NOUN
-    elif treebank_tag.startswith('R'):
-        return wordnet.ADV
-    else:
-        return wordnet.NOUN  # Default to noun if the POS tag is not found
-
-def preprocess_example(source_text, target_text, max_seq_length=512):
-
- # Tokenization
-    source_tokens = word_tokenize(source_text)
-    target_tokens = word_tokenize(target_text)
-
-    # Filter out stop words
-    source_tokens = [token for token in source_tokens if token.lower() not in stop_words]
-
-    # Part-of-speech tagging
-    source_pos_tags = pos_tag(source_tokens)
-    target_pos_tags = pos_tag(target_tokens)
-
-    # Lemmatization
-    lemmatizer = nltk.WordNetLemmatizer()
-    lemmatized_source_tokens = [lemmatizer.lemmatize(token, get_wordnet_pos(tag))
-                                 for token, tag in source_pos_tags]
-    lemmatized_target_tokens = [lemmatizer.lemmatize(token, get_wordnet_pos(tag))
-                                 for token, tag in target_pos_tags]
-
-    # Token IDs using tokenizer
-    input_ids = tokenizer.encode(lemmatized_source_tokens, truncation=True, max_length=max_seq_length)
-    label_ids = tokenizer.encode(lemmatized_target_tokens, truncation=True, max_length=max_seq_length)
-
-    # Ensure PyTorch tensors
-    input_ids = torch.tensor(input_ids)
-    attention_mask = (input_ids != tokenizer.pad_token_id).long()  # Convert to long type
-    label_ids = torch.tensor(label_ids)
-
-    return {
-        'input_ids': input_ids,
-        'attention_mask': attention_mask,
-        'labels': label_ids,
-    }
-
-# Define or import stop words
-stop_words = set(stopwords.words('english'))
-
-def fine_tune_T5(model_name, train_file, validation_file, test_file, output_dir):
-    # Load model and tokenizer
-    model = T5ForConditionalGeneration.from_pretrained(model_name)
-    tokenizer = T5Tokenizer.from_pretrained(model_name)
-
-    # Load training dataset
-    train_dataset = TextDataset(
-        tokenizer=tokenizer,
-        file_path=train_file,
-        block_size=128
-    )
-    validation_dataset = TextDataset(
-        tokenizer=tokenizer,
-        file_path=validation_file,
-        block_size=128
-    )
-
-    # Load test dataset
-    test_dataset = TextDataset(
-        tokenizer=tokenizer,
-        file_path=test_file,
-        block_size=128
-    )
-
-    # Create data collator for language modeling
-    data_collator = DataCollatorForLanguageModeling(
-        tokenizer=tokenizer, mlm=False
-    )
-
-    # Define training arguments
-    training_args = TrainingArguments(
-        output_dir=output_dir,
-        num_train_epochs=5,
-        per_device_train_batch_size=50,
-        per_device_eval_batch_size=25,
-        warmup_steps=500,
-        weight_decay=0.01,
-        save_steps=10000,
-        evaluation_strategy="epoch",
-        logging_strategy="epoch",
-        logging_dir="./logs",
-        logging_steps=1000,  # Set a specific value for how often to log
-        report_to="tensorboard",  # Set the reporting backend to TensorBoard
-    )
-
-    # Create optimizer and scheduler
-    optimizer = AdamW(model.parameters(), lr=5e-5)
-    scheduler = get_linear_schedule_with_warmup(optimizer, num_warmup_steps=500, num_training_steps=len(train_dataset) * training_args.num_train_epochs)
-
-    # Train the model
-    trainer = Trainer(
-        model=model,
-        tokenizer=tokenizer,
-        args=training_args,
-        data_collator=data_collator,
-        train_dataset=train_dataset,
-        eval_dataset=validation_dataset,
-        optimizers=(optimizer, scheduler)  # Add optimizer and scheduler to Trainer
-    )
-
-    # Fine-tune the model and save training and validation losses
-    training_losses = trainer.train()
-    validation_losses = trainer.evaluate()
-
-    # Save the losses to files
-    torch.save(training_losses, "training_loss.pt")
-    torch.save(validation_losses, "validation_loss.pt")
-
-    # Print information about the test file
-    print(f"Test file: {test_dataset}")
-
-    # Print the current working directory
-    print(f"Current working directory: {os.getcwd()}")
-
-    # Save the fine-tuned model
-    trainer.save_model(f"/content/gdrive/MyDrive/ATS/{output_dir}")
-    tokenizer.save_pretrained(f"/content/gdrive/MyDrive/ATS/{output_dir}")
-
-"""**Selection of Samples from dataset**"""
-
-def select_consecutive_examples(dataset, start_index, num_examples):
-    selected_examples = []
-    while len(selected_examples) < num_examples:
-        example = dataset[start_index]
-        if example not in selected_examples:
-            selected_examples.append(example)
-        start_index += 1  # Move to the next example
-    return selected_examples
-
-def save_preprocessed_data_to_txt(data, filename):
-  with open(filename, "w") as f:
-    for example in data:
-      example_string = str(example)
-      f.write(example_string + "\n")
-
-def load_t5_model(model_name="t5-small"):
-    model = T5ForConditionalGeneration.from_pretrained(model_name)
-    tokenizer = T5Tokenizer.from_pretrained(model_name)
-    return model, tokenizer
-
-def load_our_model(model_name):
-    model = T5ForConditionalGeneration.from_pretrained(model_name)
-    tokenizer = T5Tokenizer.from_pretrained(model_name)
-    return model, tokenizer
-
-def generate_summary(model, tokenizer, input_text):
-    input_ids = tokenizer.encode("summarize: " + input_text, return_tensors="pt", max_length=512, truncation=True)
-    summary_ids = model.generate(input_ids, max_length=150, length_penalty=0.8, num_beams=4, early_stopping=True)
-
-    summary = tokenizer.decode(summary_ids[0], skip_special_tokens=True, clean_up_tokenization_spaces=True)
-    return summary
-
-def gradio_interface(model, tokenizer):
-    def summarization(input_text):
-        summary = generate_summary(model, tokenizer, input_text)
-        return summary
-
-    iface = gr.Interface(fn=summarization, inputs="text", outputs="text",live = True)
-    iface.launch()
-
-!pip install rouge
-from rouge import Rouge
-
-from rouge import Rouge
-import json
-import pandas as pd
-
-def calculate_rouge_scores(model, tokenizer, test_dataset_path):
-    rouge = Rouge()
-    references = []
-    predictions = []
-
-    for example in test_dataset:
-        input_text = example["article"]
-        target_summary = example["highlights"]
-
-        # Generate summary using the fine-tuned model
-        summary = generate_summary(model, tokenizer, input_text)
-
-        references.append(target_summary)
-        predictions.append(summary)
-
-    scores = rouge.get_scores(predictions, references, avg=True)
-    return scores
-
-def rouge_scores_to_dataframe(rouge_scores):
-    # Convert ROUGE scores to a Pandas DataFrame
-    df = pd.DataFrame(rouge_scores).transpose()
-    df.columns = ['precision', 'recall', 'f1']
-    return df
-
-#Stage1
-# Select consecutive examples from the training dataset.
-start_index_train = 10000  # Adjust the starting index as needed
-selected_train_examples = select_consecutive_examples(train_dataset, start_index_train, 5000)
-
-# Select consecutive examples from the validation dataset.
-start_index_valid = 1000  # Adjust the starting index as needed
-selected_valid_examples = select_consecutive_examples(validation_dataset, start_index_valid, 500)
-
-# Select consecutive examples from the test dataset.
-start_index_test = 1000  # Adjust the starting index as needed
-selected_test_examples = select_consecutive_examples(test_dataset, start_index_test, 500)
-
-preprocessed_train_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_train_examples]
-preprocessed_validation_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_valid_examples]
-preprocessed_test_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_test_examples]
-
-print(f"\nPreprocessed")
-print(f"Training dataset size: {len(preprocessed_train_data)}")
-print(f"Validation dataset size: {len(preprocessed_validation_data)}")
-print(f"Test dataset size: {len(preprocessed_test_data)}")
-
-# Save the preprocessed training data.
-save_preprocessed_data_to_txt(preprocessed_train_data, "stage1_train_data.json")
-
-# Save the preprocessed validation data.
-save_preprocessed_data_to_txt(preprocessed_validation_data, "stage1_validation_data.json")
-
-# Save the preprocessed validation data.
-save_preprocessed_data_to_txt(preprocessed_test_data, "stage1_test_data.json")
-
-# Fine-tune the model stage1
-fine_tune_T5("t5-small", "/content/stage1_train_data.json","/content/stage1_validation_data.json","/content/stage1_test_data.json", "stage1_Model")
-
-#Stage2
-# Select consecutive examples from the training dataset.
-start_index_train = 10000  # Adjust the starting index as needed
-selected_train_examples = select_consecutive_examples(train_dataset, start_index_train, 5000)
-
-# Select consecutive examples from the validation dataset.
-start_index_valid = 1000  # Adjust the starting index as needed
-selected_valid_examples = select_consecutive_examples(validation_dataset, start_index_valid, 500)
-
-# Select consecutive examples from the test dataset.
-start_index_test = 1000  # Adjust the starting index as needed
-selected_test_examples = select_consecutive_examples(test_dataset, start_index_test, 200)
-
-preprocessed_train_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_train_examples]
-preprocessed_validation_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_valid_examples]
-preprocessed_test_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_test_examples]
-
-print(f"\nPreprocessed")
-print(f"Training dataset size: {len(preprocessed_train_data)}")
-print(f"Validation dataset size: {len(preprocessed_validation_data)}")
-print(f"Test dataset size: {len(preprocessed_test_data)}")
-
-# Save the preprocessed training data.
-save_preprocessed_data_to_txt(preprocessed_train_data, "stage2_train_data.json")
-
-# Save the preprocessed validation data.
-save_preprocessed_data_to_txt(preprocessed_validation_data, "stage2_validation_data.json")
-
-# Save the preprocessed validation data.
-save_preprocessed_data_to_txt(preprocessed_test_data, "stage2_test_data.json")
-
-# Fine-tune the model stage2
-fine_tune_T5("/content/drive/MyDrive/ATS/stage1_Model", "/content/stage2_train_data.json","/content/stage2_validation_data.json","/content/stage2_test_data.json", "stage2_Model")
-
-print("STAGE-2 ROUGE Scores:\n")
-
-model, tokenizer = load_our_model("/content/gdrive/MyDrive/ATS/stage2_Model")
-num_params = model.num_parameters()
-print("Number of parameters in T5-small :", num_params)
-
-test_dataset = selected_test_examples
-rouge_scoresa = calculate_rouge_scores(model, tokenizer, test_dataset)
-rouge_dff = rouge_scores_to_dataframe(rouge_scoresa)
-
-# Display the DataFrame
-print("Fine-Tuned ROUGE Scores:\n", rouge_dff)
-
-modelp, tokenizerp = load_t5_model("t5-small")
-rouge_scoresp = calculate_rouge_scores(modelp, tokenizerp, test_dataset)
-rouge_dfn = rouge_scores_to_dataframe(rouge_scoresp)
-
-# Display the DataFrame
-print("Normal ROUGE Scores:\n", rouge_dfn)
-
-#Stage3
-# Select consecutive examples from the training dataset.
-start_index_train = 20000  # Adjust the starting index as needed
-selected_train_examples = select_consecutive_examples(train_dataset, start_index_train, 5000)
-
-# Select consecutive examples from the validation dataset.
-start_index_valid = 2000  # Adjust the starting index as needed
-selected_valid_examples = select_consecutive_examples(validation_dataset, start_index_valid, 500)
-
-# Select consecutive examples from the test dataset.
-start_index_test = 2000  # Adjust the starting index as needed
-selected_test_examples = select_consecutive_examples(test_dataset, start_index_test, 500)
-
-preprocessed_train_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_train_examples]
-preprocessed_validation_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_valid_examples]
-preprocessed_test_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_test_examples]
-
-print(f"\nPreprocessed")
-print(f"Training dataset size: {len(preprocessed_train_data)}")
-print(f"Validation dataset size: {len(preprocessed_validation_data)}")
-print(f"Test dataset size: {len(preprocessed_test_data)}")
-
-# Save the preprocessed training data.
-save_preprocessed_data_to_txt(preprocessed_train_data, "stage3_train_data.json")
-
-# Save the preprocessed validation data.
-save_preprocessed_data_to_txt(preprocessed_validation_data, "stage3_validation_data.json")
-
-# Save the preprocessed validation data.
-save_preprocessed_data_to_txt(preprocessed_test_data, "stage3_test_data.json")
-
-# Fine-tune the model stage3
-fine_tune_T5("/content/drive/MyDrive/ATS/stage2_Model", "/content/stage3_train_data.json","/content/stage3_validation_data.json","/content/stage3_test_data.json", "stage3_Model")
-
-print("STAGE-3 ROUGE Scores:\n")
+from textsummarization.curriculum import SPLITS, load_curriculum, run_curriculum, stage_model_dir, stage_shard_prefix
+from textsummarization.data import load_or_preprocess_window
+from textsummarization.distributed import ddp_scaling_report
+from textsummarization.evaluation import (PredictionStore, benchmark_extractive_preselection, benchmark_inference_backends,
+                                          calculate_rouge_scores, rouge_scores_to_dataframe)
+from textsummarization.instrumentation import instrumentation
+from textsummarization.models import load_our_model, load_t5_model
+from textsummarization.serving import gradio_interface
+from textsummarization.summarization import generate_summary
+from textsummarization.training import plot_training_graph
 
-model, tokenizer = load_our_model("/content/drive/MyDrive/ATS/stage3_Model")
-num_params = model.num_parameters()
-print("Number of parameters in T5-small :", num_params)
+# Generated summaries are stored per checkpoint and example, so the t5-small baseline is only generated once
+prediction_store = PredictionStore("predictions.sqlite")
 
-test_dataset = selected_test_examples
-rouge_scoresa = calculate_rouge_scores(model, tokenizer, test_dataset)
-rouge_dff = rouge_scores_to_dataframe(rouge_scoresa)
+# Opt-in hot-path timers and counters, written to ./logs/instrumentation next to the training logs, with a
+# torch.profiler trace of training steps 20-24 (both show up in the Tensor-Board section below)
+# instrumentation.enable(profile={"train": {"start_step": 20, "num_steps": 5, "profiler": "torch"}})
 
-# Display the DataFrame
-print("Fine-Tuned ROUGE Scores:\n", rouge_dff)
+"""**Curriculum Fine-Tuning**"""
 
-modelp, tokenizerp = load_t5_model("t5-small")
-rouge_scoresp = calculate_rouge_scores(modelp, tokenizerp, test_dataset)
-rouge_dfn = rouge_scores_to_dataframe(rouge_scoresp)
-
-# Display the DataFrame
-print("Normal ROUGE Scores:\n", rouge_dfn)
+# Stages, index windows and parent checkpoints are declared in curriculum.json; completed stages are skipped
+# on a rerun, and an interrupted stage resumes from its last Trainer checkpoint
+curriculum = load_curriculum("curriculum.json")
+curriculum_state = run_curriculum(curriculum, store=prediction_store)
+print({name: record["wall_time"] for name, record in curriculum_state["stages"].items()})
 
-#Stage4
-# Select consecutive examples from the training dataset.
-start_index_train = 3000  # Adjust the starting index as needed
-selected_train_examples = select_consecutive_examples(train_dataset, start_index_train, 1000)
+# Samples/sec of one short epoch on the stage1 shards with 1, 2 and 4 gloo processes
+# ddp_scaling_report("t5-small", *(stage_shard_prefix(curriculum, "stage1", split) for split in SPLITS), process_counts=(1, 2, 4))
 
-# Select consecutive examples from the validation dataset.
-start_index_valid = 300  # Adjust the starting index as needed
-selected_valid_examples = select_consecutive_examples(validation_dataset, start_index_valid, 100)
-
-# Select consecutive examples from the test dataset.
-start_index_test = 300  # Adjust the starting index as needed
-selected_test_examples = select_consecutive_examples(test_dataset, start_index_test, 100)
-
-preprocessed_train_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_train_examples]
-preprocessed_validation_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_valid_examples]
-preprocessed_test_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_test_examples]
-
-print(f"\nPreprocessed")
-print(f"Training dataset size: {len(preprocessed_train_data)}")
-print(f"Validation dataset size: {len(preprocessed_validation_data)}")
-print(f"Test dataset size: {len(preprocessed_test_data)}")
-
-# Save the preprocessed training data.
-save_preprocessed_data_to_txt(preprocessed_train_data, "stage4_train_data.json")
-
-# Save the preprocessed validation data.
-save_preprocessed_data_to_txt(preprocessed_validation_data, "stage4_validation_data.json")
-
-# Save the preprocessed validation data.
-save_preprocessed_data_to_txt(preprocessed_test_data, "stage4_test_data.json")
-
-# Fine-tune the model stage4
-fine_tune_T5("stage3_Model", "/content/stage4_train_data.json","/content/stage4_validation_data.json","/content/stage4_test_data.json", "stage4_Model")
-
-#Stage5
-# Select consecutive examples from the training dataset.
-start_index_train = 4000  # Adjust the starting index as needed
-selected_train_examples = select_consecutive_examples(train_dataset, start_index_train, 1000)
-
-# Select consecutive examples from the validation dataset.
-start_index_valid = 400  # Adjust the starting index as needed
-selected_valid_examples = select_consecutive_examples(validation_dataset, start_index_valid, 100)
-
-# Select consecutive examples from the test dataset.
-start_index_test = 400  # Adjust the starting index as needed
-selected_test_examples = select_consecutive_examples(test_dataset, start_index_test, 100)
-
-preprocessed_train_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_train_examples]
-preprocessed_validation_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_valid_examples]
-preprocessed_test_data = [preprocess_example(example["article"], example["highlights"]) for example in selected_test_examples]
-
-print(f"\nPreprocessed")
-print(f"Training dataset size: {len(preprocessed_train_data)}")
-print(f"Validation dataset size: {len(preprocessed_validation_data)}")
-print(f"Test dataset size: {len(preprocessed_test_data)}")
-
-# Save the preprocessed training data.
-save_preprocessed_data_to_txt(preprocessed_train_data, "stage5_train_data.json")
-
-# Save the preprocessed validation data.
-save_preprocessed_data_to_txt(preprocessed_validation_data, "stage5_validation_data.json")
-
-# Save the preprocessed validation data.
-save_preprocessed_data_to_txt(preprocessed_test_data, "stage5_test_data.json")
-
-# Fine-tune the model stage5
-fine_tune_T5("stage4_Model", "/content/stage5_train_data.json","/content/stage5_validation_data.json","/content/stage5_test_data.json", "stage5_Model")
+# Test window of the last stage, used for the evaluations below
+selected_test_examples, _ = load_or_preprocess_window("test", *curriculum["stages"][-1]["test"])
 
 """**Fine-Tuning the Model**
 
 **Functions for getting Insights**
 """
 
-import matplotlib.pyplot as plt
-
-def plot_training_graph(train_losses, val_losses):
-    # Extract values from TrainOutput object
-    train_loss = train_losses.training_loss
-    val_loss = val_losses['eval_loss']
-
-    # Plot Training and Validation Loss
-    plt.plot(train_loss, label='Training Loss')
-    plt.plot(val_loss, label='Validation Loss')
-    plt.xlabel('Epoch')
-    plt.ylabel('Loss')
-    plt.legend()
-    plt.show()
-
 # # Print information about the losses
 # print("Training Losses:", training_losses)
 # print("Validation Losses:", validation_losses)
 
-# Plot Training and Validation Graph
-# plot_training_graph(training_losses, validation_losses)
+# Plot Training and Validation Graph of the last trained stage
+plot_training_graph("training_log_history.json")
 
 """**Loading Fine-Tuned Model**"""
 
-model, tokenizer = load_our_model("/content/stage4_Model")
+model, tokenizer = load_our_model(stage_model_dir(curriculum, "stage4"))
 num_params = model.num_parameters()
 print("Number of parameters in T5-small :", num_params)
 
@@ -533,19 +93,25 @@ print(f"Reference Summary length : {len(reference_summaries)}")
 # Example usage
 # Access the test split
 test_dataset = selected_test_examples
-rouge_scoresa = calculate_rouge_scores(model, tokenizer, test_dataset)
+rouge_scoresa = calculate_rouge_scores(model, tokenizer, test_dataset, store=prediction_store)
 rouge_dff = rouge_scores_to_dataframe(rouge_scoresa)
 
 # Display the DataFrame
 print("Fine-Tuned ROUGE Scores:\n", rouge_dff)
 
 modelp, tokenizerp = load_t5_model("t5-small")
-rouge_scoresp = calculate_rouge_scores(modelp, tokenizerp, test_dataset)
+rouge_scoresp = calculate_rouge_scores(modelp, tokenizerp, test_dataset, store=prediction_store)
 rouge_dfn = rouge_scores_to_dataframe(rouge_scoresp)
 
 # Display the DataFrame
 print("Normal ROUGE Scores:\n", rouge_dfn)
 
+# Compare extractive pre-selection against the full-input path on the same test window
+# benchmark_extractive_preselection(model, tokenizer, selected_test_examples)
+
+# Compare latency, weight size and ROUGE of the fp32, int8 and ONNX Runtime backends on the same test window
+# benchmark_inference_backends(stage_model_dir(curriculum, "stage4"), selected_test_examples)
+
 # Launch Gradio interface for abstractive summarization
-gradio_interface(model, tokenizer)
+gradio_interface(model, tokenizer, streaming=True)
 
@@ -0,0 +1,53 @@
+"""Abstractive text summarization with T5 fine-tuned on CNN/DailyMail.
+
+Importing the package is cheap: submodules, and the heavy libraries behind them, are only imported when one
+of the names below is first accessed.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "summarize_jsonl": "bulk",
+    "SummaryCache": "cache",
+    "StreamingSeq2SeqDataset": "corpus",
+    "iter_corpus": "corpus",
+    "run_curriculum": "curriculum",
+    "get_dataset_split": "data",
+    "load_or_preprocess_window": "data",
+    "report_split_leakage": "data",
+    "select_consecutive_examples": "data",
+    "ddp_scaling_report": "distributed",
+    "fine_tune_T5_distributed": "distributed",
+    "PredictionStore": "evaluation",
+    "calculate_rouge_scores": "evaluation",
+    "rouge_scores_to_dataframe": "evaluation",
+    "extractive_preselect": "extractive",
+    "instrumentation": "instrumentation",
+    "load_our_model": "models",
+    "load_t5_model": "models",
+    "model_registry": "models",
+    "iter_preprocessed": "preprocessing",
+    "preprocess_dataset": "preprocessing",
+    "preprocess_example": "preprocessing",
+    "InferenceService": "serving",
+    "gradio_interface": "serving",
+    "TokenShardDataset": "shards",
+    "save_token_shard": "shards",
+    "generate_summaries": "summarization",
+    "generate_summary": "summarization",
+    "summarize_long_document": "summarization",
+    "fine_tune_T5": "training",
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,149 @@
+"""Offline bulk summarization of JSONL documents across worker processes, resumable per shard."""
+
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+
+from .preprocessing import iter_chunks
+
+MANIFEST_FILE = "manifest.json"
+
+# Per-process model, loaded once by the pool initializer
+_bulk_state = {}
+
+def _init_bulk_worker(model_name, backend, num_threads, generate_kwargs):
+    import torch
+
+    from .models import load_our_model
+
+    torch.set_num_threads(num_threads)
+    _bulk_state["model"], _bulk_state["tokenizer"] = load_our_model(model_name, backend)
+    _bulk_state["generate_kwargs"] = generate_kwargs
+
+def _summarize_shard(task):
+    from .summarization import generate_summaries
+
+    shard_index, records = task
+    start_time = time.perf_counter()
+    summaries = generate_summaries(_bulk_state["model"], _bulk_state["tokenizer"], [text for _, text in records],
+                                   **_bulk_state["generate_kwargs"])
+    elapsed = time.perf_counter() - start_time
+    results = [{"id": doc_id, "summary": summary} for (doc_id, _), summary in zip(records, summaries)]
+    return shard_index, results, elapsed, os.getpid()
+
+def iter_documents(input_file, text_field="text", id_field="id"):
+    # Yields (id, text); documents without an id are keyed by their line number
+    with open(input_file, encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield record.get(id_field, line_number), record[text_field]
+
+def shard_path(output_dir, shard_index):
+    return os.path.join(output_dir, f"shard-{shard_index:06d}.jsonl")
+
+def load_manifest(output_dir, settings):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"settings": settings, "completed": {}}
+    with open(path) as f:
+        manifest = json.load(f)
+    # Shard boundaries and summaries depend on these, so a resumed run must not change them
+    if manifest["settings"] != settings:
+        raise ValueError(f"{output_dir} holds a run with different settings {manifest['settings']}; "
+                         f"use a new --output_dir")
+    return manifest
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def write_shard(output_dir, shard_index, results):
+    path = shard_path(output_dir, shard_index)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    os.replace(path + ".tmp", path)
+
+def merge_shards(output_dir, shard_indices, output_file):
+    with open(output_file + ".tmp", "w", encoding="utf-8") as out:
+        for shard_index in shard_indices:
+            with open(shard_path(output_dir, shard_index), encoding="utf-8") as f:
+                for line in f:
+                    out.write(line)
+    os.replace(output_file + ".tmp", output_file)
+
+def summarize_jsonl(input_file, output_file, output_dir=None, model_name="t5-small", backend="eager", num_workers=None,
+                    shard_size=256, output_order="input", text_field="text", id_field="id", max_inflight_shards=None,
+                    **generate_kwargs):
+    num_workers = num_workers or os.cpu_count() or 1
+    output_dir = output_dir or output_file + ".shards"
+    os.makedirs(output_dir, exist_ok=True)
+    settings = {"input_file": os.path.abspath(input_file), "model": model_name, "backend": backend,
+                "shard_size": shard_size, "text_field": text_field, "id_field": id_field,
+                "generate_kwargs": generate_kwargs}
+    manifest = load_manifest(output_dir, settings)
+    completed = manifest["completed"]
+
+    # Shards are fixed ranges of shard_size documents; ones finished by an earlier run are not summarized again
+    tasks = ((shard_index, records)
+             for shard_index, records in enumerate(iter_chunks(iter_documents(input_file, text_field, id_field), shard_size))
+             if str(shard_index) not in completed)
+
+    if output_order == "completion":
+        # Rebuilt from the finished shards in manifest order, dropping anything an interrupted run appended after
+        # its last manifest save (duplicated or truncated lines)
+        merge_shards(output_dir, [int(shard_index) for shard_index in completed], output_file)
+
+    worker_stats = {}
+    start_time = time.perf_counter()
+
+    def finish(shard_index, results, elapsed, pid):
+        write_shard(output_dir, shard_index, results)
+        # The manifest keeps shards in completion order and is saved before appending, so a resume can rebuild
+        # the completion-order file from it
+        completed[str(shard_index)] = {"docs": len(results), "seconds": elapsed}
+        save_manifest(output_dir, manifest)
+        if output_order == "completion":
+            # Keyed by id and appended as shards are collected, without waiting to restore input order
+            with open(output_file, "a", encoding="utf-8") as out:
+                for result in results:
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+        stats = worker_stats.setdefault(pid, {"docs": 0, "seconds": 0.0})
+        stats["docs"] += len(results)
+        stats["seconds"] += elapsed
+        done = sum(shard["docs"] for shard in completed.values())
+        print(f"shard {shard_index}: {len(results)} docs in {elapsed:.1f}s ({len(results) / elapsed:.1f} docs/sec), "
+              f"{done} done")
+
+    threads = max(1, (os.cpu_count() or 1) // num_workers)
+    max_inflight_shards = max_inflight_shards or 2 * num_workers
+    with multiprocessing.Pool(num_workers, initializer=_init_bulk_worker,
+                              initargs=(model_name, backend, threads, generate_kwargs)) as pool:
+        # A bounded number of shards in flight keeps memory flat however large the input is
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_summarize_shard, (task,)))
+            while pending and (len(pending) >= max_inflight_shards or pending[0].ready()):
+                finish(*pending.popleft().get())
+        while pending:
+            finish(*pending.popleft().get())
+
+    num_shards = len(completed)
+    if output_order == "input":
+        # Shards are contiguous input ranges, so concatenating them in index order restores the input order
+        merge_shards(output_dir, range(num_shards), output_file)
+
+    elapsed = time.perf_counter() - start_time
+    total_docs = sum(stats["docs"] for stats in worker_stats.values())
+    for pid, stats in sorted(worker_stats.items()):
+        print(f"worker {pid}: {stats['docs']} docs, {stats['docs'] / stats['seconds']:.1f} docs/sec")
+    print(f"Summarized {total_docs} new documents in {elapsed:.1f}s ({total_docs / elapsed:.1f} docs/sec overall, "
+          f"{num_workers} workers); {num_shards} shards complete")
+    return {"workers": worker_stats, "docs": total_docs, "seconds": elapsed, "shards": num_shards}
@@ -0,0 +1,86 @@
+"""Summary cache: an in-memory LRU tier with an optional SQLite tier shared across processes."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .models import checkpoint_fingerprint
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+class SummaryCache:
+    # In-memory LRU tier bounded by max_bytes, optionally backed by a SQLite file shared across processes
+    def __init__(self, max_bytes=64 * 1024 ** 2, db_path=None):
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def key(self, model, text, **generation_settings):
+        payload = {"model": checkpoint_fingerprint(model), "text": normalize_text(text), "generation": generation_settings}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _db(self):
+        # SQLite connections must not be shared across a fork
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT NOT NULL)")
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _remember(self, key, summary):
+        if key in self.entries:
+            self.size_bytes -= len(key) + len(self.entries.pop(key).encode("utf-8"))
+        self.entries[key] = summary
+        self.size_bytes += len(key) + len(summary.encode("utf-8"))
+        while self.size_bytes > self.max_bytes and self.entries:
+            old_key, old_summary = self.entries.popitem(last=False)
+            self.size_bytes -= len(old_key) + len(old_summary.encode("utf-8"))
+
+    def get(self, key):
+        with self._lock:
+            summary = self.entries.get(key)
+            if summary is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return summary
+
+            if self.db_path:
+                row = self._db().execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, summary):
+        with self._lock:
+            self._remember(key, summary)
+            if self.db_path:
+                with self._db() as connection:
+                    connection.execute("INSERT OR REPLACE INTO summaries (key, summary) VALUES (?, ?)", (key, summary))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.size_bytes,
+        }
@@ -0,0 +1,73 @@
+"""The ``summarize`` command line entry point."""
+
+import argparse
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="summarize", description="Summarize text with a (fine-tuned) T5 model.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input_file", help="Text file to summarize")
+    source.add_argument("--input_text", help="Text to summarize")
+    source.add_argument("--input_jsonl", help="Bulk mode: JSONL file with one document per line")
+    parser.add_argument("--output_file",
+                        help="Where to write the summary (default: summary.txt, or summaries.jsonl in bulk mode)")
+    parser.add_argument("--model", default="t5-small", help="Checkpoint name or directory (default: t5-small)")
+    parser.add_argument("--backend", default="eager", help="Inference backend: eager, int8 or onnx (default: eager)")
+    parser.add_argument("--long_document", action="store_true",
+                        help="Summarize inputs longer than the encoder window in chunks instead of truncating them")
+    parser.add_argument("--chunk_cache", default="chunk_summaries.sqlite",
+                        help="SQLite file reusing --long_document chunk summaries across runs ('' to disable)")
+    parser.add_argument("--max_length", type=int, default=150, help="Maximum summary length in tokens")
+    parser.add_argument("--num_beams", type=int, default=4, help="Beam width")
+
+    bulk = parser.add_argument_group("bulk mode (--input_jsonl)")
+    bulk.add_argument("--num_workers", type=int, help="Worker processes, each with its own model (default: CPU count)")
+    bulk.add_argument("--batch_size", type=int, default=8, help="Generation batch size per worker")
+    bulk.add_argument("--shard_size", type=int, default=256, help="Documents per resumable shard")
+    bulk.add_argument("--output_dir", help="Shard outputs and progress manifest (default: <output_file>.shards)")
+    bulk.add_argument("--output_order", choices=("input", "completion"), default="input",
+                      help="input: one line per document in input order; completion: id-keyed lines as shards finish")
+    bulk.add_argument("--text_field", default="text", help="JSONL field holding the document text")
+    bulk.add_argument("--id_field", default="id", help="JSONL field holding the document id (default: line number)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.input_jsonl:
+        from .bulk import summarize_jsonl
+
+        # Rerunning the same command resumes after the last finished shard
+        return summarize_jsonl(args.input_jsonl, args.output_file or "summaries.jsonl", output_dir=args.output_dir,
+                               model_name=args.model, backend=args.backend, num_workers=args.num_workers,
+                               shard_size=args.shard_size, output_order=args.output_order, text_field=args.text_field,
+                               id_field=args.id_field, batch_size=args.batch_size, max_length=args.max_length,
+                               num_beams=args.num_beams)
+
+    if args.input_file:
+        with open(args.input_file, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = args.input_text
+
+    # Imported after argument parsing so --help and usage errors stay instant
+    from .models import load_our_model
+    from .summarization import generate_summaries, summarize_long_document
+
+    model, tokenizer = load_our_model(args.model, args.backend)
+    if args.long_document:
+        from .cache import SummaryCache
+
+        # Persistent, so rerunning on an edited document only regenerates the chunks that changed
+        chunk_cache = SummaryCache(db_path=args.chunk_cache) if args.chunk_cache else None
+        summary = summarize_long_document(model, tokenizer, text, chunk_cache=chunk_cache, max_length=args.max_length,
+                                          num_beams=args.num_beams)
+    else:
+        summary = generate_summaries(model, tokenizer, [text], batch_size=1, max_length=args.max_length,
+                                     num_beams=args.num_beams)[0]
+
+    with open(args.output_file or "summary.txt", "w", encoding="utf-8") as f:
+        f.write(summary + "\n")
+    print(summary)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Streaming ingestion of article/highlights corpora (JSONL, Parquet or the Hub split) with flat memory use."""
+
+import copy
+import glob
+import json
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+import torch
+
+from .preprocessing import iter_chunks, iter_preprocessed
+
+CORPUS_FORMATS = {".jsonl": "jsonl", ".json": "jsonl", ".parquet": "parquet"}
+
+def expand_shards(paths):
+    # Globs and directories expand to a sorted shard list, so shard indices are stable between runs
+    if isinstance(paths, str):
+        paths = [paths]
+    shards = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = [os.path.join(path, name) for name in os.listdir(path)
+                       if os.path.splitext(name)[1] in CORPUS_FORMATS]
+        else:
+            matches = glob.glob(path)
+        shards.extend(sorted(matches))
+    if not shards:
+        raise FileNotFoundError(f"No JSONL or Parquet shards match {paths}")
+    return shards
+
+def iter_jsonl_shard(path, start_record=0, article_field="article", summary_field="highlights"):
+    with open(path, encoding="utf-8") as f:
+        for record_index, line in enumerate(f):
+            if record_index < start_record or not line.strip():
+                continue
+            record = json.loads(line)
+            yield record_index, {"article": record[article_field], "highlights": record[summary_field]}
+
+def iter_parquet_shard(path, start_record=0, article_field="article", summary_field="highlights", batch_size=1024):
+    import pyarrow.parquet as pq
+
+    # Only the two text columns are read, one record batch at a time
+    record_index = 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=[article_field, summary_field]):
+        if record_index + batch.num_rows <= start_record:
+            record_index += batch.num_rows
+            continue
+        columns = batch.to_pydict()
+        for article, highlights in zip(columns[article_field], columns[summary_field]):
+            if record_index >= start_record:
+                yield record_index, {"article": article, "highlights": highlights}
+            record_index += 1
+
+def iter_corpus(paths, start_shard=0, start_record=0, shard_filter=None, **field_names):
+    # Yields (shard_index, record_index, example); start_record applies to start_shard only
+    for shard_index, path in enumerate(expand_shards(paths)):
+        if shard_index < start_shard or (shard_filter is not None and not shard_filter(shard_index)):
+            continue
+        reader = iter_parquet_shard if CORPUS_FORMATS[os.path.splitext(path)[1]] == "parquet" else iter_jsonl_shard
+        offset = start_record if shard_index == start_shard else 0
+        for record_index, example in reader(path, offset, **field_names):
+            yield shard_index, record_index, example
+
+def iter_hub_split(split, num_splits=1, split_id=0):
+    # The CNN/DailyMail split from the Hub without downloading and materializing the whole dataset;
+    # split_id of num_splits gets whole Hub shards when they divide evenly and every num_splits-th record otherwise
+    from datasets import load_dataset
+
+    from .data import DATASET_CONFIG, DATASET_NAME
+
+    dataset = load_dataset(DATASET_NAME, DATASET_CONFIG, split=split, streaming=True)
+    if num_splits > 1:
+        from datasets.distributed import split_dataset_by_node
+
+        dataset = split_dataset_by_node(dataset, rank=split_id, world_size=num_splits)
+    yield from dataset
+
+def shuffle_buffer(iterable, buffer_size, seed=0):
+    # Each item swaps into a random slot of a fixed-size buffer; the same seed and input give the same order
+    rng = random.Random(seed)
+    buffer = []
+    for item in iterable:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        slot = rng.randrange(buffer_size)
+        yield buffer[slot]
+        buffer[slot] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+_END = object()
+
+def bounded_prefetch(iterable, max_items):
+    # Reads ahead on a background thread, never holding more than max_items unconsumed items
+    items = queue.Queue(maxsize=max_items)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            items.put(_END)
+        except BaseException as error:
+            items.put(error)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+def iter_token_budget_batches(features, max_tokens, bucket_size=4096, seed=0):
+    # Length bucketing inside a bounded window: sort bucket_size examples by source length, cut token-budget
+    # batches as LengthBucketBatchSampler does, and emit them in shuffled order
+    rng = np.random.RandomState(seed)
+    for bucket in iter_chunks(features, bucket_size):
+        bucket.sort(key=lambda example: len(example["input_ids"]))
+        batches = []
+        batch = []
+        for example in bucket:
+            if batch and len(example["input_ids"]) * (len(batch) + 1) > max_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(example)
+        if batch:
+            batches.append(batch)
+        for i in rng.permutation(len(batches)):
+            yield batches[i]
+
+def iter_replica_batches(batches, num_replicas, rank):
+    # Each rank takes one batch out of every num_replicas consecutive ones; a short final group is reused
+    # cyclically so every rank yields the same number of batches
+    for group in iter_chunks(batches, num_replicas):
+        yield group[rank % len(group)]
+
+class StreamingSeq2SeqDataset(torch.utils.data.IterableDataset):
+    # Training examples straight from JSONL/Parquet shards or a Hub split (hub_split="train"): read, shuffle and
+    # preprocess lazily with bounded read-ahead; start_shard/start_record resume an interrupted pass over local shards
+    def __init__(self, paths=None, max_seq_length=512, shuffle_buffer_size=10000, seed=0, start_shard=0,
+                 start_record=0, num_preprocess_workers=None, prefetch=1024, hub_split=None, **field_names):
+        if (paths is None) == (hub_split is None):
+            raise ValueError("Pass either paths to local shards or a hub_split")
+        self.shards = expand_shards(paths) if paths is not None else None
+        self.hub_split = hub_split
+        self.max_seq_length = max_seq_length
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = seed
+        self.start_shard = start_shard
+        self.start_record = start_record
+        self.num_preprocess_workers = num_preprocess_workers
+        self.prefetch = prefetch
+        self.field_names = field_names
+        self.num_replicas = 1
+        self.rank = 0
+        self.epoch = 0
+
+    def __repr__(self):
+        source = f"hub split {self.hub_split!r}" if self.hub_split is not None else f"{len(self.shards)} shards"
+        return (f"StreamingSeq2SeqDataset({source}, start=({self.start_shard}, {self.start_record}), "
+                f"rank {self.rank} of {self.num_replicas})")
+
+    def shard(self, num_replicas, rank):
+        # This rank's part of the input, split before preprocessing so each rank only preprocesses its own share
+        dataset = copy.copy(self)
+        dataset.num_replicas = num_replicas
+        dataset.rank = rank
+        return dataset
+
+    def set_epoch(self, epoch):
+        # Set from the main process, so DataLoader workers pick it up with their copy of the dataset
+        self.epoch = epoch
+
+    def iter_examples(self):
+        # Every (rank, DataLoader worker) pair reads its own split: whole shards when there are enough of them,
+        # every num_splits-th record otherwise
+        worker = torch.utils.data.get_worker_info()
+        num_workers, worker_id = (1, 0) if worker is None else (worker.num_workers, worker.id)
+        num_splits = self.num_replicas * num_workers
+        split_id = self.rank * num_workers + worker_id
+        if self.hub_split is not None:
+            examples = iter_hub_split(self.hub_split, num_splits, split_id)
+        elif len(self.shards) >= num_splits:
+            records = iter_corpus(self.shards, self.start_shard, self.start_record,
+                                  lambda shard_index: shard_index % num_splits == split_id, **self.field_names)
+            examples = (example for _, _, example in records)
+        else:
+            records = iter_corpus(self.shards, self.start_shard, self.start_record, **self.field_names)
+            examples = (example for i, (_, _, example) in enumerate(records) if i % num_splits == split_id)
+        if self.shuffle_buffer_size:
+            examples = shuffle_buffer(examples, self.shuffle_buffer_size, seed=f"{self.seed}:{self.epoch}:{split_id}")
+        return examples
+
+    def __iter__(self):
+        pairs = ((example["article"], example["highlights"]) for example in self.iter_examples())
+        # Inside a DataLoader worker preprocessing stays in-process instead of nesting a pool
+        num_workers = 1 if torch.utils.data.get_worker_info() is not None else self.num_preprocess_workers
+        features = iter_preprocessed(pairs, self.max_seq_length, num_workers=num_workers)
+        for example in bounded_prefetch(features, self.prefetch):
+            yield {"input_ids": example["input_ids"], "labels": example["labels"]}
+
+class TokenBudgetBatches(torch.utils.data.IterableDataset):
+    # Wraps a streaming dataset into ready-made lists of examples for DataLoader(batch_size=None). With
+    # num_replicas > 1 each rank batches its own split of the input; datasets without shard() are read in full by
+    # every rank, which then keeps every num_replicas-th batch
+    def __init__(self, dataset, max_tokens, bucket_size=4096, seed=0, num_replicas=1, rank=0):
+        self.split_input = num_replicas > 1 and hasattr(dataset, "shard")
+        self.dataset = dataset.shard(num_replicas, rank) if self.split_input else dataset
+        self.max_tokens = max_tokens
+        self.bucket_size = bucket_size
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        # Called by the Trainer in the main process each epoch, before DataLoader workers copy the dataset
+        self.epoch = epoch
+
+    def _epoch_batches(self, epoch):
+        if hasattr(self.dataset, "set_epoch"):
+            self.dataset.set_epoch(epoch)
+        batches = iter_token_budget_batches(iter(self.dataset), self.max_tokens, self.bucket_size, self.seed + epoch)
+        if self.num_replicas > 1 and not self.split_input:
+            batches = iter_replica_batches(batches, self.num_replicas, self.rank)
+        return batches
+
+    def __iter__(self):
+        if self.num_replicas == 1:
+            yield from self._epoch_batches(self.epoch)
+            return
+        # Ranks hold different amounts of data, so their batch counts differ: each rank repeats its stream epoch
+        # after epoch and they all stop together at max_steps, never at an epoch end the others have not reached
+        epoch = self.epoch
+        while True:
+            num_batches = 0
+            for batch in self._epoch_batches(epoch):
+                num_batches += 1
+                yield batch
+            if not num_batches:
+                raise ValueError(f"Rank {self.rank} of {self.num_replicas} has no training data; use more shards "
+                                 f"or fewer processes")
+            epoch += 1
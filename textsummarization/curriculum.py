@@ -0,0 +1,190 @@
+"""Resumable multi-stage curriculum fine-tuning driven by a declarative stage config (see curriculum.json)."""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .data import load_or_preprocess_window, report_split_leakage
+from .shards import save_token_shard
+
+SPLITS = ("train", "validation", "test")
+
+# Default Trainer checkpoint interval within a stage, so an interrupted stage resumes instead of restarting
+STAGE_SAVE_STEPS = 500
+
+# Preprocessing runs on a background thread, so its pool is spawned rather than forked from a threaded process
+PREPARE_MP_CONTEXT = "spawn"
+
+def load_curriculum(config):
+    if isinstance(config, dict):
+        return config
+    with open(config) as f:
+        return json.load(f)
+
+def stage_model_dir(config, stage_name):
+    return os.path.join(config["output_root"], f"{stage_name}_Model")
+
+def stage_checkpoint_dir(config, stage_name):
+    return os.path.join(config["checkpoint_root"], f"{stage_name}_Model")
+
+def stage_shard_prefix(config, stage_name, split):
+    return os.path.join(config["data_dir"], f"{stage_name}_{split}_data")
+
+def resolve_parent(config, parent):
+    # A parent naming an earlier stage resolves to that stage's saved model, anything else is a checkpoint name
+    if parent in {stage["name"] for stage in config["stages"]}:
+        return stage_model_dir(config, parent)
+    return parent
+
+def load_state(state_path):
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            return json.load(f)
+    return {"stages": {}}
+
+def save_state(state, state_path):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+def stage_config_hash(config, stage, stage_hashes, fine_tune_kwargs=None):
+    # Everything that shapes a stage's model, including its parent's hash, so a changed stage also invalidates
+    # the stages trained from it; "evaluate" only decides whether ROUGE is reported
+    payload = {
+        "stage": {key: value for key, value in stage.items() if key != "evaluate"},
+        "parent": stage_hashes.get(stage["parent"], stage["parent"]),
+        "max_seq_length": config.get("max_seq_length", 512),
+        "training": {**config.get("training", {}), **(fine_tune_kwargs or {})},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+
+def prepare_stage(config, stage, num_workers=None):
+    # Windows come from the preprocessing cache when their inputs are unchanged
+    start_time = time.perf_counter()
+    examples = {}
+    # A stage with a "corpus" streams its training data, only validation and test are windows
+    for split in SPLITS[1:] if "corpus" in stage else SPLITS:
+        start_index, num_examples = stage[split]
+        examples[split], features = load_or_preprocess_window(split, start_index, num_examples,
+                                                               max_seq_length=config.get("max_seq_length", 512),
+                                                               num_workers=num_workers, mp_context=PREPARE_MP_CONTEXT)
+        save_token_shard(features, stage_shard_prefix(config, stage["name"], split))
+    if "train" in examples:
+        report_split_leakage(examples["train"], examples["test"])
+    return {"test_examples": examples["test"], "seconds": time.perf_counter() - start_time}
+
+def latest_trainer_checkpoint(checkpoint_dir):
+    if not os.path.isdir(checkpoint_dir):
+        return None
+    checkpoints = [name for name in os.listdir(checkpoint_dir) if name.startswith("checkpoint-")]
+    if not checkpoints:
+        return None
+    return os.path.join(checkpoint_dir, max(checkpoints, key=lambda name: int(name.split("-")[-1])))
+
+def train_stage(config, stage, **fine_tune_kwargs):
+    from .distributed import fine_tune_T5_distributed
+    from .models import model_registry
+
+    name = stage["name"]
+    checkpoint_dir = stage_checkpoint_dir(config, name)
+    train_data = stage_shard_prefix(config, name, "train")
+    if "corpus" in stage:
+        from .corpus import StreamingSeq2SeqDataset
+
+        # JSONL/Parquet shards or a Hub split read lazily; the stage's training options must then set max_steps
+        train_data = StreamingSeq2SeqDataset(max_seq_length=config.get("max_seq_length", 512), **stage["corpus"])
+    # num_processes > 1 trains data-parallel replicas over gloo, with the same checkpoint layout
+    fine_tune_T5_distributed(
+        stage.get("num_processes", config.get("num_processes", 1)),
+        resolve_parent(config, stage["parent"]),
+        train_data,
+        *(stage_shard_prefix(config, name, split) for split in SPLITS[1:]),
+        checkpoint_dir,
+        save_dir=stage_model_dir(config, name),
+        # Picks up mid-stage Trainer checkpoints left by an interrupted run
+        resume_from_checkpoint=latest_trainer_checkpoint(checkpoint_dir),
+        max_seq_length=config.get("max_seq_length", 512),
+        # Training options (memory budget, gradient checkpointing, bf16) from the config, overridable per stage
+        **{"save_steps": STAGE_SAVE_STEPS, **config.get("training", {}), **stage.get("training", {}),
+           **fine_tune_kwargs},
+    )
+    # A retrained stage must not be served from a stale registry entry
+    model_registry.evict(stage_model_dir(config, name))
+
+def evaluate_stage(config, stage, test_examples, store=None):
+    from .evaluation import calculate_rouge_scores, rouge_scores_to_dataframe
+    from .models import load_our_model
+
+    scores = {}
+    for label, model_name in (("fine_tuned", stage_model_dir(config, stage["name"])),
+                              ("baseline", config.get("baseline_model", "t5-small"))):
+        model, tokenizer = load_our_model(model_name)
+        scores[label] = calculate_rouge_scores(model, tokenizer, test_examples, store=store)
+        print(f"{stage['name']} {label} ROUGE Scores:\n", rouge_scores_to_dataframe(scores[label]))
+    return scores
+
+def run_curriculum(config, state_path=None, store=None, **fine_tune_kwargs):
+    config = load_curriculum(config)
+    state_path = state_path or os.path.join(config["output_root"], "curriculum_state.json")
+    os.makedirs(config["output_root"], exist_ok=True)
+    os.makedirs(config["data_dir"], exist_ok=True)
+    state = load_state(state_path)
+
+    stage_hashes = {}
+    remaining = []
+    for stage in config["stages"]:
+        name = stage["name"]
+        stage_hashes[name] = stage_config_hash(config, stage, stage_hashes, fine_tune_kwargs)
+        record = state["stages"].get(name, {})
+        # Records from before config hashes were stored are trusted as they are
+        if record.get("config_hash", stage_hashes[name]) != stage_hashes[name]:
+            print(f"{name}: config changed since it was trained, running it again")
+            # Trainer checkpoints of the old config must not be resumed
+            shutil.rmtree(stage_checkpoint_dir(config, name), ignore_errors=True)
+            state["stages"][name] = record = {}
+        if record.get("completed"):
+            print(f"{name}: already completed, skipping")
+        else:
+            remaining.append(stage)
+
+    # Preparation of stage N+1 runs in the background while stage N trains, on a share of the cores
+    # ("prepare_workers") so it does not starve the training threads; the first stage has the machine to itself
+    prepare_workers = config.get("prepare_workers", max(1, (os.cpu_count() or 1) // 4))
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(prepare_stage, config, remaining[0]) if remaining else None
+        for i, stage in enumerate(remaining):
+            record = state["stages"].setdefault(stage["name"], {})
+            record.setdefault("wall_time", {})
+            record["config_hash"] = stage_hashes[stage["name"]]
+            stage_start = time.perf_counter()
+
+            wait_start = time.perf_counter()
+            prepared = pending.result()
+            record["wall_time"]["prepare"] = prepared["seconds"]
+            record["wall_time"]["prepare_wait"] = time.perf_counter() - wait_start
+            record["prepared"] = True
+            save_state(state, state_path)
+            pending = (executor.submit(prepare_stage, config, remaining[i + 1], prepare_workers)
+                       if i + 1 < len(remaining) else None)
+
+            if not record.get("trained"):
+                train_start = time.perf_counter()
+                train_stage(config, stage, **fine_tune_kwargs)
+                record["wall_time"]["train"] = time.perf_counter() - train_start
+                record["trained"] = True
+                save_state(state, state_path)
+
+            if stage.get("evaluate"):
+                evaluate_start = time.perf_counter()
+                record["rouge"] = evaluate_stage(config, stage, prepared["test_examples"], store=store)
+                record["wall_time"]["evaluate"] = time.perf_counter() - evaluate_start
+
+            record["wall_time"]["total"] = time.perf_counter() - stage_start
+            record["completed"] = True
+            save_state(state, state_path)
+            print(f"{stage['name']}: completed in {record['wall_time']['total']:.0f}s")
+    return state
@@ -0,0 +1,188 @@
+"""CNN/DailyMail loading, deduplicated window selection and the on-disk preprocessing cache."""
+
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+import torch
+
+from .preprocessing import get_preprocessing_tokenizer, get_stop_words, preprocess_dataset
+
+DATASET_NAME = "cnn_dailymail"
+DATASET_CONFIG = "3.0.0"
+
+cnn_daily_mail = None
+
+def get_dataset_split(split):
+    # Loaded on first use so stages served from the preprocessing cache never touch the dataset
+    global cnn_daily_mail
+    if cnn_daily_mail is None:
+        from datasets import load_dataset
+
+        cnn_daily_mail = load_dataset(DATASET_NAME, DATASET_CONFIG)
+    return cnn_daily_mail[split]
+
+SELECTION_INDEX_DIR = "selection_index"
+
+def article_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+def build_article_hash_index(dataset, index_dir=SELECTION_INDEX_DIR, batch_size=10000):
+    # One int64 hash per row, persisted per dataset fingerprint so it is only computed once
+    fingerprint = getattr(dataset, "_fingerprint", None)
+    index_path = os.path.join(index_dir, f"{fingerprint}.npy") if fingerprint else None
+    if index_path and os.path.exists(index_path):
+        return np.load(index_path, mmap_mode="r")
+
+    if hasattr(dataset, "with_format"):
+        # Read the article column in Arrow batches instead of row by row
+        articles = dataset.with_format(None, columns=["article"])
+        hashes = np.empty(len(articles), dtype=np.int64)
+        for start in range(0, len(articles), batch_size):
+            batch = articles[start:start + batch_size]["article"]
+            hashes[start:start + len(batch)] = [article_hash(article) for article in batch]
+    else:
+        hashes = np.fromiter((article_hash(example["article"]) for example in dataset), dtype=np.int64, count=len(dataset))
+
+    if index_path:
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(index_path, hashes)
+    return hashes
+
+MINHASH_PRIME = (1 << 31) - 1
+
+class MinHashLSH:
+    def __init__(self, num_perm=64, bands=16, threshold=0.8, shingle_size=5, seed=0):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MINHASH_PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, MINHASH_PRIME, size=num_perm).astype(np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.buckets = {}
+        self.signatures = {}
+
+    def signature(self, text):
+        words = text.lower().split()
+        shingles = {" ".join(words[i:i + self.shingle_size])
+                    for i in range(max(1, len(words) - self.shingle_size + 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        # a < 2**31 and hashes < 2**32, so the products fit in uint64
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % MINHASH_PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def query(self, signature):
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self.buckets.get(band_key, ()))
+        return [key for key in candidates
+                if np.mean(self.signatures[key] == signature) >= self.threshold]
+
+    def insert(self, key, signature):
+        self.signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self.buckets.setdefault(band_key, []).append(key)
+
+def select_consecutive_examples(dataset, start_index, num_examples, near_duplicates=False, exclude_hashes=None,
+                                index_dir=SELECTION_INDEX_DIR):
+    hashes = build_article_hash_index(dataset, index_dir)
+    seen = set(exclude_hashes or ())
+    lsh = MinHashLSH() if near_duplicates else None
+    selected_indices = []
+
+    position = start_index
+    while len(selected_indices) < num_examples:
+        if position >= len(hashes):
+            raise IndexError(f"Only {len(selected_indices)} unique examples after index {start_index}, "
+                             f"{num_examples} requested")
+        block = hashes[position:position + 2 * (num_examples - len(selected_indices)) + 16].tolist()
+        for offset, row_hash in enumerate(block):
+            if row_hash in seen:
+                continue
+            seen.add(row_hash)
+            index = position + offset
+            if lsh is not None:
+                signature = lsh.signature(dataset[index]["article"])
+                if lsh.query(signature):
+                    continue
+                lsh.insert(index, signature)
+            selected_indices.append(index)
+            if len(selected_indices) == num_examples:
+                break
+        position += len(block)
+
+    if hasattr(dataset, "select"):
+        return dataset.select(selected_indices)
+    return [dataset[index] for index in selected_indices]
+
+def report_split_leakage(train_examples, test_examples, near_duplicates=False):
+    train_hashes = {article_hash(example["article"]) for example in train_examples}
+    exact = [i for i, example in enumerate(test_examples) if article_hash(example["article"]) in train_hashes]
+
+    near = []
+    if near_duplicates:
+        lsh = MinHashLSH()
+        for i, example in enumerate(train_examples):
+            lsh.insert(i, lsh.signature(example["article"]))
+        near = [i for i, example in enumerate(test_examples)
+                if i not in exact and lsh.query(lsh.signature(example["article"]))]
+
+    print(f"Train/test leakage: {len(exact)} exact and {len(near)} near-duplicate test articles")
+    return {"exact": exact, "near": near}
+
+# Bump when preprocess_example / preprocess_dataset output or the window selection changes
+# (2: windows deduplicated by article hash instead of whole-row equality)
+PREPROCESS_VERSION = 2
+PREPROCESS_CACHE_DIR = "preprocess_cache"
+PREPROCESS_CACHE_MAX_BYTES = 20 * 1024 ** 3
+
+def preprocess_cache_key(split, start_index, num_examples, max_seq_length):
+    tokenizer = get_preprocessing_tokenizer()
+    key = {
+        "dataset": [DATASET_NAME, DATASET_CONFIG, split],
+        "window": [start_index, num_examples],
+        "max_seq_length": max_seq_length,
+        "tokenizer": [type(tokenizer).__name__, tokenizer.name_or_path, len(tokenizer), tokenizer.pad_token_id],
+        "options": {"stop_words": sorted(get_stop_words()), "lemmatize": True},
+        "version": PREPROCESS_VERSION,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+def evict_preprocess_cache(cache_dir, max_bytes):
+    # Least recently used entries go first; hits refresh the file mtime
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".pt")]
+    entries.sort(key=os.path.getmtime)
+    total_bytes = sum(os.path.getsize(path) for path in entries)
+    while entries and total_bytes > max_bytes:
+        path = entries.pop(0)
+        total_bytes -= os.path.getsize(path)
+        os.remove(path)
+
+def load_or_preprocess_window(split, start_index, num_examples, max_seq_length=512,
+                              cache_dir=PREPROCESS_CACHE_DIR, max_cache_bytes=PREPROCESS_CACHE_MAX_BYTES,
+                              num_workers=None, mp_context=None):
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, preprocess_cache_key(split, start_index, num_examples, max_seq_length) + ".pt")
+
+    if os.path.exists(cache_path):
+        os.utime(cache_path)
+        entry = torch.load(cache_path)
+        print(f"Loaded {split}[{start_index}:{start_index + num_examples}] from preprocessing cache")
+        return entry["examples"], entry["features"]
+
+    examples = [dict(example) for example in select_consecutive_examples(get_dataset_split(split), start_index, num_examples)]
+    features = preprocess_dataset(examples, max_seq_length=max_seq_length, num_workers=num_workers,
+                                  mp_context=mp_context)
+
+    # Write to a temporary file first so an interrupted run never leaves a partial entry
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    torch.save({"examples": examples, "features": features}, tmp_path)
+    os.replace(tmp_path, cache_path)
+    evict_preprocess_cache(cache_dir, max_cache_bytes)
+    return examples, features
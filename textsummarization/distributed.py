@@ -0,0 +1,65 @@
+"""CPU data-parallel fine-tuning: one gloo process per model replica on the local machine."""
+
+import json
+import os
+import socket
+import tempfile
+
+import torch
+import torch.multiprocessing as mp
+
+DDP_BACKEND = "gloo"
+THROUGHPUT_FILE = "train_throughput.json"
+
+def threads_per_process(num_processes):
+    # Replicas split the cores evenly instead of each one spinning up a full-size intra-op pool
+    return max(1, (os.cpu_count() or 1) // num_processes)
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _ddp_worker(rank, world_size, master_port, fine_tune_args, fine_tune_kwargs):
+    num_threads = threads_per_process(world_size)
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = str(num_threads)
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+
+    # The Trainer picks these up and initializes the process group through Accelerate
+    os.environ.update(MASTER_ADDR="127.0.0.1", MASTER_PORT=str(master_port), RANK=str(rank),
+                      LOCAL_RANK=str(rank), WORLD_SIZE=str(world_size), LOCAL_WORLD_SIZE=str(world_size))
+
+    from .training import fine_tune_T5
+    fine_tune_T5(*fine_tune_args, **fine_tune_kwargs)
+
+def fine_tune_T5_distributed(num_processes, *fine_tune_args, **fine_tune_kwargs):
+    # Same arguments as fine_tune_T5; each process trains on every num_processes-th bucketed batch
+    if num_processes <= 1:
+        from .training import fine_tune_T5
+        return fine_tune_T5(*fine_tune_args, **fine_tune_kwargs)
+    mp.spawn(_ddp_worker, args=(num_processes, free_port(), fine_tune_args, fine_tune_kwargs), nprocs=num_processes)
+
+def ddp_scaling_report(model_name, train_file, validation_file, test_file, process_counts=(1, 2, 4),
+                       num_train_epochs=1, **fine_tune_kwargs):
+    # Short runs on the same shards; samples/sec comes from the Trainer's own train_runtime on rank 0
+    report = []
+    for num_processes in process_counts:
+        with tempfile.TemporaryDirectory() as output_dir:
+            fine_tune_T5_distributed(num_processes, model_name, train_file, validation_file, test_file, output_dir,
+                                     save_dir=os.path.join(output_dir, "model"), num_train_epochs=num_train_epochs,
+                                     **fine_tune_kwargs)
+            with open(os.path.join(output_dir, THROUGHPUT_FILE)) as f:
+                throughput = json.load(f)
+        report.append({"num_processes": num_processes, "threads_per_process": threads_per_process(num_processes),
+                       "samples_per_sec": throughput["samples_per_sec"]})
+
+    per_process_baseline = report[0]["samples_per_sec"] / report[0]["num_processes"]
+    for row in report:
+        row["speedup"] = row["samples_per_sec"] / report[0]["samples_per_sec"]
+        row["scaling_efficiency"] = row["samples_per_sec"] / (per_process_baseline * row["num_processes"])
+        print(f"{row['num_processes']:3d} processes x {row['threads_per_process']:3d} threads: "
+              f"{row['samples_per_sec']:8.1f} samples/sec  speedup {row['speedup']:.2f}x  "
+              f"efficiency {row['scaling_efficiency']:.0%}")
+    return report
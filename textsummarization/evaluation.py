@@ -0,0 +1,251 @@
+"""ROUGE evaluation, plus the extractive and inference-backend comparisons built on it."""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+
+from .extractive import extractive_stats
+from .instrumentation import instrumentation
+from .models import INFERENCE_BACKENDS, checkpoint_fingerprint, current_rss_bytes, load_our_model, model_memory_bytes
+from .summarization import generate_summaries
+
+ROUGE_METRICS = ("rouge-1", "rouge-2", "rouge-l")
+
+# Same definitions as rouge.Rouge (the package this replaced), so scores stay comparable with earlier runs:
+# case-sensitive words split on "." and " ", n-gram sets rather than counts, summary-level union LCS for ROUGE-L
+def _rouge_sentences(text):
+    return [" ".join(sentence.split()) for sentence in text.split(".") if len(sentence) > 0]
+
+def _rouge_words(sentences):
+    return [word for sentence in sentences for word in sentence.split(" ")]
+
+def _f_p_r(overlap, hypothesis_total, reference_total):
+    precision = overlap / hypothesis_total if hypothesis_total else 0.0
+    recall = overlap / reference_total if reference_total else 0.0
+    f_score = 2.0 * ((precision * recall) / (precision + recall + 1e-8))
+    return {"f": f_score, "p": precision, "r": recall}
+
+def _ngrams(words, n):
+    return set(zip(*(words[i:] for i in range(n))))
+
+def _lcs_words(x, y):
+    # Words of the LCS that rouge.Rouge reconstructs, with its tie-breaking, by an iterative backtrack
+    table = [[0] * (len(y) + 1) for _ in range(len(x) + 1)]
+    for i in range(1, len(x) + 1):
+        row, previous_row = table[i], table[i - 1]
+        for j in range(1, len(y) + 1):
+            row[j] = previous_row[j - 1] + 1 if x[i - 1] == y[j - 1] else max(previous_row[j], row[j - 1])
+    words = set()
+    i, j = len(x), len(y)
+    while i and j:
+        if x[i - 1] == y[j - 1]:
+            words.add(x[i - 1])
+            i, j = i - 1, j - 1
+        elif table[i - 1][j] > table[i][j - 1]:
+            i -= 1
+        else:
+            j -= 1
+    return words
+
+def rouge_pair_scores(hypothesis, reference):
+    hypothesis_sentences = _rouge_sentences(hypothesis)
+    reference_sentences = _rouge_sentences(reference)
+    # rouge.Rouge raises on an empty side; scoring it 0 keeps one empty prediction from aborting an evaluation
+    if not hypothesis_sentences or not reference_sentences:
+        return {metric: {"f": 0.0, "p": 0.0, "r": 0.0} for metric in ROUGE_METRICS}
+    hypothesis_words = _rouge_words(hypothesis_sentences)
+    reference_words = _rouge_words(reference_sentences)
+
+    scores = {}
+    for n in (1, 2):
+        hypothesis_ngrams = _ngrams(hypothesis_words, n)
+        reference_ngrams = _ngrams(reference_words, n)
+        scores[f"rouge-{n}"] = _f_p_r(len(hypothesis_ngrams & reference_ngrams), len(hypothesis_ngrams),
+                                      len(reference_ngrams))
+
+    # Union over every (reference sentence, hypothesis sentence) LCS, counted as distinct words
+    hypothesis_split = [sentence.split(" ") for sentence in hypothesis_sentences]
+    union = set()
+    for reference_sentence in reference_sentences:
+        reference_sentence_words = reference_sentence.split(" ")
+        for words in hypothesis_split:
+            union |= _lcs_words(reference_sentence_words, words)
+    scores["rouge-l"] = _f_p_r(len(union), len(set(hypothesis_words)), len(set(reference_words)))
+    return scores
+
+def _score_chunk(pairs):
+    with instrumentation.timer("rouge.score_chunk"):
+        scores = [rouge_pair_scores(hypothesis, reference) for hypothesis, reference in pairs]
+    instrumentation.count("rouge.pairs", len(scores))
+    return scores, instrumentation.drain()
+
+def _collect_scores(output):
+    scores, stats = output
+    instrumentation.merge(stats)
+    return scores
+
+def iter_rouge_scores(predictions, references, num_workers=None, chunk_size=256):
+    # Yields (pairs scored so far, running average) as chunks finish, scoring chunks across processes
+    pairs = list(zip(predictions, references))
+    chunks = [pairs[start:start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+    num_workers = min(num_workers or os.cpu_count() or 1, len(chunks)) or 1
+
+    totals = {metric: {"f": 0.0, "p": 0.0, "r": 0.0} for metric in ROUGE_METRICS}
+    scored = 0
+
+    def running_average(chunk_scores):
+        nonlocal scored
+        for scores in chunk_scores:
+            for metric in ROUGE_METRICS:
+                for key in ("f", "p", "r"):
+                    totals[metric][key] += scores[metric][key]
+        scored += len(chunk_scores)
+        return scored, {metric: {key: value / scored for key, value in totals[metric].items()} for metric in ROUGE_METRICS}
+
+    if num_workers == 1:
+        for chunk in chunks:
+            yield running_average(_collect_scores(_score_chunk(chunk)))
+        return
+    with multiprocessing.Pool(num_workers) as pool:
+        for output in pool.imap_unordered(_score_chunk, chunks):
+            yield running_average(_collect_scores(output))
+
+def rouge_scores(predictions, references, num_workers=None):
+    # Averaged ROUGE-1/2/L in the {"rouge-1": {"f", "p", "r"}, ...} layout of rouge.Rouge.get_scores(avg=True)
+    average = {metric: {"f": 0.0, "p": 0.0, "r": 0.0} for metric in ROUGE_METRICS}
+    for _, average in iter_rouge_scores(predictions, references, num_workers=num_workers):
+        pass
+    return average
+
+def example_id(example):
+    if example.get("id"):
+        return str(example["id"])
+    return hashlib.sha1(example["article"].encode("utf-8")).hexdigest()
+
+class PredictionStore:
+    # Generated summaries persisted per (checkpoint, generation settings, example id) in SQLite
+    def __init__(self, db_path="predictions.sqlite"):
+        self.db_path = db_path
+        self._connection = None
+        self._connection_pid = None
+
+    def _db(self):
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.db_path, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS predictions (checkpoint TEXT NOT NULL, "
+                                     "example_id TEXT NOT NULL, summary TEXT NOT NULL, "
+                                     "PRIMARY KEY (checkpoint, example_id))")
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def get_many(self, checkpoint, example_ids):
+        found = {}
+        ids = list(example_ids)
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            rows = self._db().execute(
+                f"SELECT example_id, summary FROM predictions WHERE checkpoint = ? AND example_id IN ({','.join('?' * len(batch))})",
+                [checkpoint, *batch])
+            found.update(rows)
+        return found
+
+    def put_many(self, checkpoint, predictions):
+        with self._db() as connection:
+            connection.executemany("INSERT OR REPLACE INTO predictions (checkpoint, example_id, summary) VALUES (?, ?, ?)",
+                                   [(checkpoint, example_id, summary) for example_id, summary in predictions.items()])
+
+def predict_summaries(model, tokenizer, examples, store=None, batch_size=8, flush_every=64, **generate_kwargs):
+    ids = [example_id(example) for example in examples]
+    checkpoint = checkpoint_fingerprint(model) + json.dumps(generate_kwargs, sort_keys=True)
+    predictions = store.get_many(checkpoint, ids) if store is not None else {}
+
+    # Generate only what is missing, flushing to the store as we go so an interrupted run keeps its progress
+    missing = [i for i, id_ in enumerate(ids) if id_ not in predictions]
+    for start in range(0, len(missing), flush_every):
+        chunk = missing[start:start + flush_every]
+        summaries = generate_summaries(model, tokenizer, [examples[i]["article"] for i in chunk],
+                                       batch_size=batch_size, **generate_kwargs)
+        generated = {ids[i]: summary for i, summary in zip(chunk, summaries)}
+        predictions.update(generated)
+        if store is not None:
+            store.put_many(checkpoint, generated)
+    return [predictions[id_] for id_ in ids]
+
+def iter_evaluation(model, tokenizer, examples, store=None, num_workers=None, batch_size=8, **generate_kwargs):
+    examples = list(examples)
+    predictions = predict_summaries(model, tokenizer, examples, store=store, batch_size=batch_size, **generate_kwargs)
+    references = [example["highlights"] for example in examples]
+    yield from iter_rouge_scores(predictions, references, num_workers=num_workers)
+
+def calculate_rouge_scores(model, tokenizer, test_dataset, extractive_budget=None, store=None, num_workers=None):
+    scores = {metric: {"f": 0.0, "p": 0.0, "r": 0.0} for metric in ROUGE_METRICS}
+    for scored, scores in iter_evaluation(model, tokenizer, test_dataset, store=store, num_workers=num_workers,
+                                          extractive_budget=extractive_budget):
+        print(f"ROUGE after {scored} examples: " + ", ".join(f"{metric} F {scores[metric]['f']:.4f}" for metric in ROUGE_METRICS))
+    return scores
+
+def rouge_scores_to_dataframe(rouge_scores):
+    import pandas as pd
+
+    # Convert ROUGE scores to a Pandas DataFrame
+    df = pd.DataFrame(rouge_scores).transpose()[["p", "r", "f"]]
+    df.columns = ['precision', 'recall', 'f1']
+    return df
+
+def benchmark_extractive_preselection(model, tokenizer, test_examples, token_budget=256):
+    results = {}
+    for name, extractive_budget in (("full_input", None), ("extractive", token_budget)):
+        extractive_stats.update(documents=0, seconds=0.0)
+        start_time = time.perf_counter()
+        scores = calculate_rouge_scores(model, tokenizer, test_examples, extractive_budget=extractive_budget)
+        elapsed = time.perf_counter() - start_time
+        results[name] = {
+            "seconds_per_doc": elapsed / len(test_examples),
+            "extractive_seconds_per_doc": extractive_stats["seconds"] / len(test_examples),
+            "rouge": scores,
+        }
+        print(f"{name}: {results[name]['seconds_per_doc'] * 1000:.0f} ms/doc "
+              f"(extractive {results[name]['extractive_seconds_per_doc'] * 1000:.1f} ms/doc), "
+              f"ROUGE-1 F {scores['rouge-1']['f']:.4f}, ROUGE-L F {scores['rouge-l']['f']:.4f}")
+    return results
+
+def check_backend_parity(reference_model, model, tokenizer, test_examples, batch_size=8):
+    articles = [example["article"] for example in test_examples]
+    references = [example["highlights"] for example in test_examples]
+
+    start_time = time.perf_counter()
+    reference_summaries = generate_summaries(reference_model, tokenizer, articles, batch_size=batch_size)
+    reference_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    summaries = generate_summaries(model, tokenizer, articles, batch_size=batch_size)
+    seconds = time.perf_counter() - start_time
+
+    return {
+        "exact_match": sum(a == b for a, b in zip(summaries, reference_summaries)) / len(summaries),
+        "rouge_vs_fp32": rouge_scores(summaries, reference_summaries),
+        "rouge": rouge_scores(summaries, references),
+        "fp32_rouge": rouge_scores(reference_summaries, references),
+        "ms_per_doc": seconds / len(articles) * 1000,
+        "fp32_ms_per_doc": reference_seconds / len(articles) * 1000,
+    }
+
+def benchmark_inference_backends(model_name, test_examples, backends=INFERENCE_BACKENDS):
+    reference_model, tokenizer = load_our_model(model_name)
+    results = {}
+    for backend in backends:
+        rss_before = current_rss_bytes()
+        model = reference_model if backend == "eager" else load_our_model(model_name, backend)[0]
+        rss_delta = current_rss_bytes() - rss_before
+
+        results[backend] = check_backend_parity(reference_model, model, tokenizer, test_examples)
+        results[backend].update(weights_bytes=model_memory_bytes(model), load_rss_delta_bytes=rss_delta)
+        print(f"{backend}: {results[backend]['ms_per_doc']:.0f} ms/doc (fp32 {results[backend]['fp32_ms_per_doc']:.0f}), "
+              f"weights {results[backend]['weights_bytes'] / 1024 ** 2:.0f} MiB, "
+              f"exact match {results[backend]['exact_match']:.2%}, "
+              f"ROUGE-L F {results[backend]['rouge']['rouge-l']['f']:.4f} (fp32 {results[backend]['fp32_rouge']['rouge-l']['f']:.4f})")
+    return results
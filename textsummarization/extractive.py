@@ -0,0 +1,73 @@
+"""Fast extractive pre-selection (TF-IDF + TextRank in NumPy) to shrink the encoder input."""
+
+import re
+import time
+
+import numpy as np
+
+from .preprocessing import get_stop_words, split_sentences
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Cumulative time spent in extractive_preselect, kept apart from generation time
+extractive_stats = {"documents": 0, "seconds": 0.0}
+
+def textrank_scores(sentences, damping=0.85, max_iterations=50, tolerance=1e-6):
+    # TF-IDF sentence vectors, cosine similarity graph, then PageRank by power iteration
+    stop_words = get_stop_words()
+    tokenized = [[word for word in WORD_PATTERN.findall(sentence.lower()) if word not in stop_words]
+                 for sentence in sentences]
+    vocabulary = {}
+    rows, cols = [], []
+    for row, words in enumerate(tokenized):
+        for word in words:
+            rows.append(row)
+            cols.append(vocabulary.setdefault(word, len(vocabulary)))
+
+    num_sentences = len(sentences)
+    term_frequency = np.zeros((num_sentences, max(len(vocabulary), 1)))
+    if rows:
+        np.add.at(term_frequency, (rows, cols), 1.0)
+    document_frequency = (term_frequency > 0).sum(axis=0)
+    tfidf = term_frequency * (np.log((1 + num_sentences) / (1 + document_frequency)) + 1)
+
+    norms = np.linalg.norm(tfidf, axis=1, keepdims=True)
+    unit_vectors = tfidf / np.where(norms > 0, norms, 1.0)
+    similarity = unit_vectors @ unit_vectors.T
+    np.fill_diagonal(similarity, 0.0)
+
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    transition = np.divide(similarity, row_sums, out=np.full_like(similarity, 1.0 / num_sentences), where=row_sums > 0)
+    scores = np.full(num_sentences, 1.0 / num_sentences)
+    for _ in range(max_iterations):
+        new_scores = (1 - damping) / num_sentences + damping * (transition.T @ scores)
+        converged = np.abs(new_scores - scores).sum() < tolerance
+        scores = new_scores
+        if converged:
+            break
+    return scores
+
+def extractive_preselect(text, tokenizer, token_budget=256):
+    start_time = time.perf_counter()
+    sentences = split_sentences(text)
+    sentence_lengths = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]] if sentences else []
+
+    if len(sentences) > 1 and sum(sentence_lengths) > token_budget:
+        chosen = []
+        total = 0
+        ranking = np.argsort(-textrank_scores(sentences), kind="stable").tolist()
+        for i in ranking:
+            if total + sentence_lengths[i] <= token_budget:
+                chosen.append(i)
+                total += sentence_lengths[i]
+        if chosen:
+            # Keep the selected sentences in document order
+            text = " ".join(sentences[i] for i in sorted(chosen))
+        else:
+            # Every sentence is longer than the budget: keep the top-ranked one, truncated to fit
+            top_ids = tokenizer(sentences[ranking[0]], add_special_tokens=False)["input_ids"][:token_budget]
+            text = tokenizer.decode(top_ids, skip_special_tokens=True)
+
+    extractive_stats["documents"] += 1
+    extractive_stats["seconds"] += time.perf_counter() - start_time
+    return text
@@ -0,0 +1,217 @@
+"""Opt-in timers, counters and sampled profiling of the hot paths, exported to TensorBoard under ./logs.
+
+Disabled by default: timer() then hands back a shared no-op context manager and count() returns at once, so
+the instrumented call sites cost a function call each. Enable with instrumentation.enable(...), or for a whole
+process tree by setting TEXTSUMMARIZATION_INSTRUMENT to a log directory.
+"""
+
+import atexit
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+
+INSTRUMENTATION_LOG_DIR = os.path.join("./logs", "instrumentation")
+PROFILERS = ("torch", "cprofile")
+
+_NULL_TIMER = contextlib.nullcontext()
+
+class _Timer:
+    __slots__ = ("instrumentation", "name", "start")
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.record(self.name, time.perf_counter() - self.start)
+
+class ProfileWindow:
+    # Profiles steps [start_step, start_step + num_steps) of one target ("train" or "generate") and writes a
+    # TensorBoard trace (torch.profiler) or a .prof file plus top functions (cProfile) to log_dir
+    def __init__(self, target, log_dir, start_step=10, num_steps=5, profiler="torch"):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler {profiler!r}, expected one of {PROFILERS}")
+        self.target = target
+        self.log_dir = log_dir
+        self.start_step = start_step
+        self.num_steps = num_steps
+        self.profiler = profiler
+        self.steps = 0
+        self._active = None
+
+    def step(self):
+        if self.steps == self.start_step:
+            self._start()
+        elif self.steps == self.start_step + self.num_steps and self._active is not None:
+            self._stop()
+        self.steps += 1
+
+    def _start(self):
+        if self.profiler == "torch":
+            import torch
+
+            self._active = torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU],
+                record_shapes=True,
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(self.log_dir, worker_name=self.target),
+            )
+            self._active.start()
+        else:
+            self._active = cProfile.Profile()
+            self._active.enable()
+
+    def _stop(self):
+        if self.profiler == "torch":
+            self._active.stop()
+        else:
+            self._active.disable()
+            path = os.path.join(self.log_dir, f"{self.target}_steps{self.start_step}-{self.steps - 1}.prof")
+            self._active.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(self._active, stream=summary).sort_stats("cumulative").print_stats(30)
+            with open(path[:-len(".prof")] + ".txt", "w") as f:
+                f.write(summary.getvalue())
+        print(f"Profiled {self.target} steps {self.start_step}-{self.steps - 1} with {self.profiler} into {self.log_dir}")
+        self._active = None
+
+class Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self.log_dir = INSTRUMENTATION_LOG_DIR
+        self.flush_secs = 30
+        self.profile_windows = {}
+        self._lock = threading.Lock()
+        self._timers = defaultdict(lambda: [0, 0.0])
+        self._counters = defaultdict(int)
+        self._writer = None
+        self._owner_pid = None
+        self._export_step = 0
+        self._last_export = 0.0
+
+    def enable(self, log_dir=INSTRUMENTATION_LOG_DIR, flush_secs=30, profile=None):
+        # profile: {"train": {"start_step": 10, "num_steps": 5, "profiler": "torch"}, "generate": {...}}
+        self.log_dir = log_dir
+        self.flush_secs = flush_secs
+        self.profile_windows = {target: ProfileWindow(target, log_dir, **settings)
+                                for target, settings in (profile or {}).items()}
+        self._owner_pid = os.getpid()
+        self._last_export = time.perf_counter()
+        self.enabled = True
+
+    def disable(self):
+        self.export()
+        self.enabled = False
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            timer = self._timers[name]
+            timer[0] += 1
+            timer[1] += seconds
+        self._maybe_export()
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] += value
+
+    def profile_step(self, target):
+        if not self.enabled:
+            return
+        window = self.profile_windows.get(target)
+        if window is not None:
+            window.step()
+
+    def drain(self):
+        # Stats gathered in a pool worker since its last task, returned to the parent along with the results
+        if not self.enabled:
+            return None
+        with self._lock:
+            stats = ({name: tuple(timer) for name, timer in self._timers.items()}, dict(self._counters))
+            self._timers.clear()
+            self._counters.clear()
+        return stats
+
+    def merge(self, stats):
+        if stats is None or not self.enabled:
+            return
+        timers, counters = stats
+        with self._lock:
+            for name, (calls, seconds) in timers.items():
+                self._timers[name][0] += calls
+                self._timers[name][1] += seconds
+            for name, value in counters.items():
+                self._counters[name] += value
+
+    def attach_model_hooks(self, model):
+        # Times every encoder and decoder forward (one decoder call per generated token) through module hooks
+        # ONNX Runtime models have no module hooks and are only timed as a whole
+        if not self.enabled or not hasattr(model, "register_forward_hook") or getattr(model, "_instrumentation_hooks", None):
+            return
+        handles = []
+        for name, module in (("generate.encoder", model.get_encoder()), ("generate.decoder_step", model.get_decoder())):
+            def pre_hook(module, args):
+                module._instrumentation_start = time.perf_counter()
+
+            def post_hook(module, args, output, name=name):
+                if self.enabled:
+                    self.record(name, time.perf_counter() - module._instrumentation_start)
+
+            handles.append(module.register_forward_pre_hook(pre_hook))
+            handles.append(module.register_forward_hook(post_hook))
+        model._instrumentation_hooks = handles
+
+    def _maybe_export(self):
+        if os.getpid() == self._owner_pid and time.perf_counter() - self._last_export >= self.flush_secs:
+            self.export()
+
+    def export(self, step=None):
+        # Mean milliseconds and call counts per timer, plus counters, for the interval since the last export;
+        # forked pool workers never write, their stats arrive through merge()
+        if not self.enabled or os.getpid() != self._owner_pid:
+            return
+        with self._lock:
+            timers = {name: tuple(timer) for name, timer in self._timers.items()}
+            counters = dict(self._counters)
+            self._timers.clear()
+            self._counters.clear()
+        self._last_export = time.perf_counter()
+        if not timers and not counters:
+            return
+
+        if self._writer is None:
+            from torch.utils.tensorboard import SummaryWriter
+
+            self._writer = SummaryWriter(log_dir=self.log_dir)
+        step = self._export_step if step is None else step
+        self._export_step = step + 1
+        for name, (calls, seconds) in timers.items():
+            self._writer.add_scalar(f"time_ms/{name}", seconds / calls * 1000, step)
+            self._writer.add_scalar(f"total_s/{name}", seconds, step)
+            self._writer.add_scalar(f"calls/{name}", calls, step)
+        for name, value in counters.items():
+            self._writer.add_scalar(f"count/{name}", value, step)
+        self._writer.flush()
+
+instrumentation = Instrumentation()
+atexit.register(instrumentation.export)
+
+if os.environ.get("TEXTSUMMARIZATION_INSTRUMENT"):
+    instrumentation.enable(os.environ["TEXTSUMMARIZATION_INSTRUMENT"])
@@ -0,0 +1,225 @@
+"""Model and tokenizer loading: inference backends and the shared, memory-mapped model registry."""
+
+import io
+import os
+import re
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+
+import torch
+from safetensors.torch import load_file as load_safetensors
+from transformers import GenerationConfig, T5Config, T5ForConditionalGeneration, T5Tokenizer
+
+# eager: fp32 PyTorch, int8: dynamic int8 quantization of every Linear layer,
+# onnx: encoder/decoder/decoder-with-past graphs exported to ONNX Runtime (needs optimum[onnxruntime])
+INFERENCE_BACKENDS = ("eager", "int8", "onnx")
+
+def load_t5_model(model_name="t5-small", backend="eager"):
+    return load_our_model(model_name, backend)
+
+def load_our_model(model_name, backend="eager"):
+    # Shared, warm instances from the registry instead of a fresh from_pretrained per call
+    return model_registry.get(model_name, backend), model_registry.tokenizer(model_name)
+
+MODEL_CACHE_DIR = "model_cache"
+
+class ModelRegistry:
+    # Loads each (checkpoint, backend) once, hands out the shared instance and evicts the least recently used
+    # models once resident weights exceed max_resident_bytes
+    def __init__(self, max_resident_bytes=4 * 1024 ** 3, cache_dir=MODEL_CACHE_DIR):
+        self.max_resident_bytes = max_resident_bytes
+        self.cache_dir = cache_dir
+        self.models = OrderedDict()
+        self.tokenizers = {}
+        self.resident_bytes = 0
+        self._lock = threading.RLock()
+
+    def converted_dir(self, model_name, kind):
+        # Cache directory for a converted copy of model_name; a local checkpoint's weights stamp is part of the
+        # name, so retraining it in place converts again instead of serving the stale copy
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "--", model_name.strip("/"))
+        stamp = weights_stamp(model_name)
+        if stamp is not None:
+            # Not "@", which the Hub loaders read as a revision
+            name = f"{name}__{stamp.replace(':', '-')}"
+        return os.path.join(self.cache_dir, kind, name)
+
+    def build_once(self, target_dir, marker_file, build):
+        # build(tmp_dir) writes a complete copy that is renamed into place; a directory that exists is complete
+        if os.path.isfile(os.path.join(target_dir, marker_file)):
+            return target_dir
+        os.makedirs(os.path.dirname(target_dir), exist_ok=True)
+        tmp_dir = f"{target_dir}.{os.getpid()}.tmp"
+        try:
+            build(tmp_dir)
+            os.replace(tmp_dir, target_dir)
+        except OSError:
+            # Another process built the same copy first; its copy is complete, so use that
+            if not os.path.isfile(os.path.join(target_dir, marker_file)):
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        # Copies made from earlier weights of the same checkpoint are not used again
+        parent_dir, target_name = os.path.split(target_dir)
+        prefix = target_name.split("__")[0] + "__"
+        for name in os.listdir(parent_dir):
+            if name.startswith(prefix) and name != target_name and not name.endswith(".tmp"):
+                shutil.rmtree(os.path.join(parent_dir, name), ignore_errors=True)
+        return target_dir
+
+    def safetensors_checkpoint(self, model_name):
+        # Hub and .bin checkpoints are converted to safetensors once and reused from the local cache
+        if os.path.isfile(os.path.join(model_name, "model.safetensors")):
+            return model_name
+        return self.build_once(
+            self.converted_dir(model_name, "safetensors"), "model.safetensors",
+            lambda tmp_dir: T5ForConditionalGeneration.from_pretrained(model_name).save_pretrained(
+                tmp_dir, safe_serialization=True),
+        )
+
+    def load_mmap(self, model_name):
+        checkpoint_dir = self.safetensors_checkpoint(model_name)
+        config = T5Config.from_pretrained(checkpoint_dir)
+        config._name_or_path = model_name
+        with torch.device("meta"):
+            model = T5ForConditionalGeneration(config)
+
+        # assign=True keeps the file-backed tensors, so processes loading the same checkpoint share pages
+        state_dict = load_safetensors(os.path.join(checkpoint_dir, "model.safetensors"))
+        model.load_state_dict(state_dict, strict=False, assign=True)
+        model.tie_weights()
+        missing = [name for name, tensor in model.state_dict().items() if tensor.is_meta]
+        if missing:
+            raise ValueError(f"Checkpoint {model_name} is missing weights: {missing}")
+
+        try:
+            model.generation_config = GenerationConfig.from_pretrained(checkpoint_dir)
+        except OSError:
+            pass
+        return model.eval()
+
+    def _load(self, model_name, backend):
+        if backend == "eager":
+            return self.load_mmap(model_name)
+        if backend == "int8":
+            # Quantize a private instance in place; embeddings and layer norms stay memory-mapped
+            return torch.quantization.quantize_dynamic(self.load_mmap(model_name), {torch.nn.Linear},
+                                                       dtype=torch.qint8, inplace=True)
+        if backend == "onnx":
+            try:
+                from optimum.onnxruntime import ORTModelForSeq2SeqLM
+            except ImportError:
+                raise ImportError("The onnx inference backend needs optimum and onnxruntime: pip install optimum[onnxruntime]")
+            # Exported once into the model cache; later cold loads, in any process, only read the ONNX files
+            export_dir = self.build_once(
+                self.converted_dir(model_name, "onnx"), "config.json",
+                lambda tmp_dir: ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, use_cache=True)
+                .save_pretrained(tmp_dir),
+            )
+            model = ORTModelForSeq2SeqLM.from_pretrained(export_dir, export=False, use_cache=True)
+            # Identified by its source checkpoint, like the other backends
+            model.config._name_or_path = model_name
+            return model
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
+
+    def get(self, model_name, backend="eager"):
+        key = (model_name, backend)
+        with self._lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key][0]
+
+            model = self._load(model_name, backend)
+            model.inference_backend = backend
+            if backend == "eager":
+                size_bytes = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+            else:
+                size_bytes = model_memory_bytes(model)
+            self.models[key] = (model, size_bytes)
+            self.resident_bytes += size_bytes
+
+            while self.resident_bytes > self.max_resident_bytes and len(self.models) > 1:
+                _, (_, evicted_bytes) = self.models.popitem(last=False)
+                self.resident_bytes -= evicted_bytes
+            return model
+
+    def tokenizer(self, model_name):
+        # Loaded on first use, independently of the model and shared by all backends
+        with self._lock:
+            if model_name not in self.tokenizers:
+                self.tokenizers[model_name] = T5Tokenizer.from_pretrained(model_name)
+            return self.tokenizers[model_name]
+
+    def evict(self, model_name=None):
+        with self._lock:
+            for key in [key for key in self.models if model_name is None or key[0] == model_name]:
+                self.resident_bytes -= self.models.pop(key)[1]
+
+model_registry = ModelRegistry()
+
+def model_identity(model):
+    # Checkpoint plus backend, since quantized or exported models do not reproduce fp32 output exactly
+    name_or_path = getattr(model, "name_or_path", None) or model.config._name_or_path
+    return f"{name_or_path}:{getattr(model, 'inference_backend', 'eager')}"
+
+def weights_stamp(name_or_path):
+    # mtime and size of a local checkpoint's weights file; None for Hub names
+    for weights_name in ("model.safetensors", "pytorch_model.bin"):
+        weights_path = os.path.join(name_or_path, weights_name)
+        if os.path.isfile(weights_path):
+            stat = os.stat(weights_path)
+            return f"{stat.st_mtime_ns}:{stat.st_size}"
+    return None
+
+def checkpoint_fingerprint(model):
+    # Identity plus the weights file's mtime and size, so a checkpoint retrained in place reads as a new one
+    identity = model_identity(model)
+    stamp = weights_stamp(getattr(model, "name_or_path", None) or model.config._name_or_path)
+    return identity if stamp is None else f"{identity}@{stamp}"
+
+def _max_rss_bytes():
+    # Lifetime peak RSS where /proc is unavailable; ru_maxrss is in KiB on Linux and in bytes on macOS
+    import resource
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # An upper bound: the peak so far
+        return _max_rss_bytes()
+
+# Cleared once writing clear_refs fails (non-Linux hosts, sandboxes), so the failure is not retried every step
+_peak_rss_resettable = True
+
+def peak_rss_bytes(reset=False):
+    # VmHWM is the process's RSS high-water mark; writing 5 to clear_refs restarts it from the current RSS.
+    # Without them this is the lifetime peak from getrusage, which never goes down
+    global _peak_rss_resettable
+    try:
+        with open("/proc/self/status") as f:
+            peak = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        return _max_rss_bytes()
+    if reset and _peak_rss_resettable:
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            _peak_rss_resettable = False
+    return peak
+
+def model_memory_bytes(model):
+    if isinstance(model, torch.nn.Module):
+        # Serialized state dict also covers packed int8 weights, which are not parameters
+        buffer = io.BytesIO()
+        torch.save(model.state_dict(), buffer)
+        return buffer.tell()
+    model_dir = str(model.model_save_dir)
+    return sum(os.path.getsize(os.path.join(model_dir, name)) for name in os.listdir(model_dir) if name.endswith(".onnx"))
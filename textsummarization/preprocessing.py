@@ -0,0 +1,237 @@
+"""NLTK preprocessing of article/highlight pairs into T5 input_ids, attention_mask and labels."""
+
+import multiprocessing
+import os
+import time
+from collections import deque
+from functools import lru_cache
+
+import nltk
+import torch
+from nltk import pos_tag
+from nltk.corpus import stopwords, wordnet
+from nltk.tag.perceptron import PerceptronTagger
+from nltk.tokenize import sent_tokenize, word_tokenize
+
+from .instrumentation import instrumentation
+
+NLTK_RESOURCES = {
+    "stopwords": "corpora/stopwords",
+    "punkt": "tokenizers/punkt",
+    "wordnet": "corpora/wordnet",
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+}
+
+PREPROCESSING_TOKENIZER = "t5-small"
+
+@lru_cache(maxsize=None)
+def ensure_nltk_data():
+    # Only download corpora that are not already installed, once per process
+    for package, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            nltk.download(package)
+
+@lru_cache(maxsize=None)
+def get_stop_words():
+    ensure_nltk_data()
+    return frozenset(stopwords.words('english'))
+
+@lru_cache(maxsize=None)
+def get_preprocessing_tokenizer(model_name=None):
+    from transformers import T5Tokenizer
+
+    # Read at call time, so a local tokenizer directory can stand in for t5-small (the benchmark fixture does)
+    tokenizer = T5Tokenizer.from_pretrained(model_name or PREPROCESSING_TOKENIZER)
+    tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+def split_sentences(text):
+    ensure_nltk_data()
+    return sent_tokenize(text)
+
+def get_wordnet_pos(treebank_tag):
+    if treebank_tag.startswith('J'):
+        return wordnet.ADJ
+    elif treebank_tag.startswith('V'):
+        return wordnet.VERB
+    elif treebank_tag.startswith('N'):
+        return wordnet.NOUN
+    elif treebank_tag.startswith('R'):
+        return wordnet.ADV
+    else:
+        return wordnet.NOUN  # Default to noun if the POS tag is not found
+
+def preprocess_example(source_text, target_text, max_seq_length=512):
+    stop_words = get_stop_words()
+    tokenizer = get_preprocessing_tokenizer()
+
+    # Tokenization
+    with instrumentation.timer("nltk.tokenize"):
+        source_tokens = word_tokenize(source_text)
+        target_tokens = word_tokenize(target_text)
+
+    # Filter out stop words
+    source_tokens = [token for token in source_tokens if token.lower() not in stop_words]
+
+    # Part-of-speech tagging
+    with instrumentation.timer("nltk.pos_tag"):
+        source_pos_tags = pos_tag(source_tokens)
+        target_pos_tags = pos_tag(target_tokens)
+
+    # Lemmatization
+    with instrumentation.timer("nltk.lemmatize"):
+        lemmatizer = nltk.WordNetLemmatizer()
+        lemmatized_source_tokens = [lemmatizer.lemmatize(token, get_wordnet_pos(tag))
+                                     for token, tag in source_pos_tags]
+        lemmatized_target_tokens = [lemmatizer.lemmatize(token, get_wordnet_pos(tag))
+                                     for token, tag in target_pos_tags]
+
+    # Token IDs using tokenizer
+    with instrumentation.timer("sentencepiece.encode"):
+        input_ids = tokenizer.encode(lemmatized_source_tokens, truncation=True, max_length=max_seq_length)
+        label_ids = tokenizer.encode(lemmatized_target_tokens, truncation=True, max_length=max_seq_length)
+
+    return to_model_features(input_ids, label_ids)
+
+def to_model_features(input_ids, label_ids):
+    # Ensure PyTorch tensors
+    input_ids = torch.tensor(input_ids)
+    attention_mask = (input_ids != get_preprocessing_tokenizer().pad_token_id).long()  # Convert to long type
+    label_ids = torch.tensor(label_ids)
+
+    return {
+        'input_ids': input_ids,
+        'attention_mask': attention_mask,
+        'labels': label_ids,
+    }
+
+# Per-process NLTK state: one tagger and lemmatizer per worker instead of one per article
+_preprocess_state = {}
+
+def _init_preprocess_worker(lemma_cache_size):
+    ensure_nltk_data()
+    lemmatizer = nltk.WordNetLemmatizer()
+
+    # (token, wordnet POS) -> lemma lookups repeat heavily across news articles
+    @lru_cache(maxsize=lemma_cache_size)
+    def cached_lemmatize(token, wordnet_pos):
+        return lemmatizer.lemmatize(token, wordnet_pos)
+
+    _preprocess_state["tagger"] = PerceptronTagger()
+    _preprocess_state["lemmatize"] = cached_lemmatize
+    _preprocess_state["stop_words"] = get_stop_words()
+    _preprocess_state["tokenizer"] = get_preprocessing_tokenizer()
+
+def _preprocess_ids(source_text, target_text, max_seq_length):
+    tagger = _preprocess_state["tagger"]
+    lemmatize = _preprocess_state["lemmatize"]
+    stop_words = _preprocess_state["stop_words"]
+    tokenizer = _preprocess_state["tokenizer"]
+
+    # Same steps as preprocess_example, with the shared tagger and lemma cache
+    with instrumentation.timer("nltk.tokenize"):
+        source_tokens = [token for token in word_tokenize(source_text) if token.lower() not in stop_words]
+        target_tokens = word_tokenize(target_text)
+
+    with instrumentation.timer("nltk.pos_tag"):
+        source_pos_tags = tagger.tag(source_tokens)
+        target_pos_tags = tagger.tag(target_tokens)
+
+    with instrumentation.timer("nltk.lemmatize"):
+        lemmatized_source_tokens = [lemmatize(token, get_wordnet_pos(tag)) for token, tag in source_pos_tags]
+        lemmatized_target_tokens = [lemmatize(token, get_wordnet_pos(tag)) for token, tag in target_pos_tags]
+
+    with instrumentation.timer("sentencepiece.encode"):
+        input_ids = tokenizer.encode(lemmatized_source_tokens, truncation=True, max_length=max_seq_length)
+        label_ids = tokenizer.encode(lemmatized_target_tokens, truncation=True, max_length=max_seq_length)
+    return input_ids, label_ids
+
+def _preprocess_chunk(args):
+    pairs, max_seq_length = args
+    results = [_preprocess_ids(source_text, target_text, max_seq_length) for source_text, target_text in pairs]
+    instrumentation.count("preprocess.articles", len(results))
+    # Worker-side timings travel back with the results (None when instrumentation is off)
+    return results, instrumentation.drain()
+
+def _collect_chunk(output):
+    results, stats = output
+    instrumentation.merge(stats)
+    return results
+
+def iter_article_pairs(dataset):
+    # Accepts a datasets split, a list of examples or any iterable of (article, highlights) pairs
+    for example in dataset:
+        if isinstance(example, dict):
+            yield example["article"], example["highlights"]
+        else:
+            source_text, target_text = example
+            yield source_text, target_text
+
+def iter_chunks(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def preprocess_dataset(dataset, max_seq_length=512, num_workers=None, chunk_size=64, lemma_cache_size=100000,
+                       mp_context=None):
+    num_workers = num_workers or os.cpu_count() or 1
+    tasks = ((chunk, max_seq_length) for chunk in iter_chunks(iter_article_pairs(dataset), chunk_size))
+
+    # Loaded before the pool starts so forked workers inherit them instead of loading their own
+    get_stop_words()
+    get_preprocessing_tokenizer()
+
+    start_time = time.perf_counter()
+    if num_workers == 1:
+        _init_preprocess_worker(lemma_cache_size)
+        results = [result for task in tasks for result in _collect_chunk(_preprocess_chunk(task))]
+    else:
+        # mp_context="spawn" when the caller has other threads running, since forking a threaded process can deadlock
+        with multiprocessing.get_context(mp_context).Pool(num_workers, initializer=_init_preprocess_worker,
+                                                          initargs=(lemma_cache_size,)) as pool:
+            # imap keeps the original example order
+            results = [result for output in pool.imap(_preprocess_chunk, tasks) for result in _collect_chunk(output)]
+    elapsed = time.perf_counter() - start_time
+
+    preprocessed_data = [to_model_features(input_ids, label_ids) for input_ids, label_ids in results]
+
+    articles_per_sec = len(preprocessed_data) / elapsed if elapsed > 0 else float("inf")
+    print(f"Preprocessed {len(preprocessed_data)} articles in {elapsed:.1f}s "
+          f"({articles_per_sec:.1f} articles/sec, {num_workers} workers)")
+    return preprocessed_data
+
+def iter_preprocessed(pairs, max_seq_length=512, num_workers=None, chunk_size=64, max_inflight_chunks=None,
+                      lemma_cache_size=100000):
+    # Streaming counterpart of preprocess_dataset: at most max_inflight_chunks chunks are read ahead of the
+    # consumer (Pool.imap would drain the whole input), so memory stays flat for any corpus size
+    num_workers = num_workers or os.cpu_count() or 1
+    max_inflight_chunks = max_inflight_chunks or 2 * num_workers
+    tasks = ((chunk, max_seq_length) for chunk in iter_chunks(pairs, chunk_size))
+
+    get_stop_words()
+    get_preprocessing_tokenizer()
+
+    if num_workers == 1:
+        _init_preprocess_worker(lemma_cache_size)
+        for task in tasks:
+            for input_ids, label_ids in _collect_chunk(_preprocess_chunk(task)):
+                yield to_model_features(input_ids, label_ids)
+        return
+
+    with multiprocessing.Pool(num_workers, initializer=_init_preprocess_worker, initargs=(lemma_cache_size,)) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_preprocess_chunk, (task,)))
+            if len(pending) >= max_inflight_chunks:
+                for input_ids, label_ids in _collect_chunk(pending.popleft().get()):
+                    yield to_model_features(input_ids, label_ids)
+        while pending:
+            for input_ids, label_ids in _collect_chunk(pending.popleft().get()):
+                yield to_model_features(input_ids, label_ids)
@@ -0,0 +1,225 @@
+"""Interactive serving: the micro-batching inference service, its JSON endpoint and the Gradio UI."""
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .cache import SummaryCache
+from .summarization import generate_summaries, generate_summary, percentile_ms
+
+# Larger request bodies are refused before they are read
+MAX_REQUEST_BYTES = 1024 ** 2
+
+class InferenceService:
+    # Coalesces concurrent requests into micro-batches on a single model worker thread
+    def __init__(self, model, tokenizer, max_batch_size=8, max_wait_ms=20, max_queue_size=64, debounce_ms=300,
+                 cache=None, latency_window=10000):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.debounce = debounce_ms / 1000
+        self.cache = cache
+        self.loop = None
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.latest_request = {}
+        self._request_ids = itertools.count(1)
+        self.latencies = deque(maxlen=latency_window)
+        self.batch_sizes = Counter()
+        self.superseded = 0
+        self.rejected = 0
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.max_queue_size)
+        self.batcher = asyncio.create_task(self._batch_loop())
+
+    def start_in_thread(self):
+        # For synchronous callers such as Gradio handlers
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.start(), loop).result()
+        return loop
+
+    async def submit(self, text, is_current=None):
+        future = self.loop.create_future()
+        try:
+            # Bounded queue: reject instead of letting latency grow without limit
+            self.queue.put_nowait((text, future, time.perf_counter(), is_current))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        return await future
+
+    async def submit_live(self, client_id, text):
+        # Debounced: returns None when a newer request from the same client superseded this one
+        if client_id is None:
+            return await self.submit(text)
+
+        # Ids are never reused, so a client's entry can go as soon as its latest request is done
+        request_id = next(self._request_ids)
+        self.latest_request[client_id] = request_id
+
+        def is_current():
+            return self.latest_request.get(client_id) == request_id
+
+        try:
+            await asyncio.sleep(self.debounce)
+            if not is_current():
+                self.superseded += 1
+                return None
+            return await self.submit(text, is_current)
+        finally:
+            if is_current():
+                del self.latest_request[client_id]
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = self.loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_loop(self):
+        while True:
+            batch = []
+            for text, future, enqueued_at, is_current in await self._next_batch():
+                if future.done():
+                    continue
+                if is_current is not None and not is_current():
+                    self.superseded += 1
+                    future.set_result(None)
+                    continue
+                batch.append((text, future, enqueued_at))
+            if not batch:
+                continue
+
+            self.batch_sizes[len(batch)] += 1
+            try:
+                summaries = await self.loop.run_in_executor(
+                    self.executor,
+                    partial(generate_summaries, self.model, self.tokenizer, [text for text, _, _ in batch],
+                            batch_size=len(batch), cache=self.cache),
+                )
+            except Exception as error:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            finished_at = time.perf_counter()
+            for (_, future, enqueued_at), summary in zip(batch, summaries):
+                if not future.done():
+                    future.set_result(summary)
+                    self.latencies.append(finished_at - enqueued_at)
+
+    def stats(self):
+        return {
+            "requests": len(self.latencies),
+            "p50_ms": percentile_ms(self.latencies, 0.50),
+            "p99_ms": percentile_ms(self.latencies, 0.99),
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "superseded": self.superseded,
+            "rejected": self.rejected,
+        }
+
+    async def _handle_http(self, reader, writer):
+        # Minimal JSON endpoint: POST /summarize {"text": ...} and GET /stats
+        try:
+            method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            content_length = int(headers.get("content-length", 0))
+
+            if content_length > MAX_REQUEST_BYTES:
+                status, response = 413, {"error": f"request body over {MAX_REQUEST_BYTES} bytes"}
+            elif method == "POST" and path == "/summarize":
+                try:
+                    text = json.loads(await reader.readexactly(content_length))["text"]
+                    if not isinstance(text, str):
+                        raise TypeError(text)
+                except (ValueError, KeyError, TypeError):
+                    status, response = 400, {"error": "expected a JSON body with a 'text' field"}
+                else:
+                    # Failures past parsing are the server's, not the client's
+                    try:
+                        status, response = 200, {"summary": await self.submit(text)}
+                    except asyncio.QueueFull:
+                        status, response = 503, {"error": "queue full"}
+                    except Exception as error:
+                        status, response = 500, {"error": f"summarization failed: {type(error).__name__}"}
+            elif method == "GET" and path == "/stats":
+                status, response = 200, self.stats()
+            else:
+                status, response = 404, {"error": "not found"}
+        except (ValueError, asyncio.IncompleteReadError):
+            status, response = 400, {"error": "malformed request"}
+
+        payload = json.dumps(response).encode("utf-8")
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                   500: "Internal Server Error", 503: "Service Unavailable"}
+        writer.write(f"HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+        await writer.drain()
+        writer.close()
+
+    async def serve_http(self, host="127.0.0.1", port=8000):
+        # Unauthenticated, so loopback only unless a host is given explicitly
+        return await asyncio.start_server(self._handle_http, host, port)
+
+def gradio_interface(model, tokenizer, cache=None, service=None, http_port=None, http_host="127.0.0.1",
+                     streaming=False):
+    import gradio as gr
+
+    if streaming:
+        # Streaming trades micro-batching for time-to-first-token, so it runs on submit instead of per keystroke
+        def streaming_summarization(input_text):
+            yield ""
+            if input_text.strip():
+                yield from generate_summary(model, tokenizer, input_text, stream=True)
+
+        iface = gr.Interface(fn=streaming_summarization, inputs="text", outputs="text")
+        iface.launch()
+        return
+
+    cache = cache if cache is not None else SummaryCache()
+    service = service if service is not None else InferenceService(model, tokenizer, cache=cache)
+    loop = service.start_in_thread()
+    # The JSON endpoint is opt-in: it has no authentication
+    if http_port:
+        asyncio.run_coroutine_threadsafe(service.serve_http(http_host, http_port), loop).result()
+
+    def summarization(input_text, request: gr.Request):
+        if not input_text.strip():
+            return ""
+        client_id = request.session_hash if request is not None else None
+        try:
+            summary = asyncio.run_coroutine_threadsafe(service.submit_live(client_id, input_text), loop).result()
+        except asyncio.QueueFull:
+            raise gr.Error("The summarizer is busy, please try again.")
+        # Superseded keystrokes leave the current output untouched
+        return gr.update() if summary is None else summary
+
+    # Gradio runs one handler at a time per event by default; concurrent sessions must reach the batcher together
+    iface = gr.Interface(fn=summarization, inputs="text", outputs="text", live=True,
+                         concurrency_limit=service.max_queue_size)
+    iface.launch()
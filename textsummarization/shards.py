@@ -0,0 +1,92 @@
+"""Binary token shards: a flat memory-mapped token array plus an offsets index."""
+
+import json
+
+import numpy as np
+import torch
+
+# A shard is <prefix>.bin (flat token array: input_ids then labels of every example),
+# <prefix>.idx.npy (start offset, input length, label length per example) and <prefix>.json
+TOKEN_SHARD_DTYPE = np.int32
+
+def save_token_shard(data, prefix, write_chunk_size=4096):
+    index = np.zeros((len(data), 3), dtype=np.int64)
+    offset = 0
+    with open(prefix + ".bin", "wb") as f:
+        for chunk_start in range(0, len(data), write_chunk_size):
+            arrays = []
+            for i, example in enumerate(data[chunk_start:chunk_start + write_chunk_size], start=chunk_start):
+                input_ids = np.asarray(example["input_ids"], dtype=TOKEN_SHARD_DTYPE)
+                labels = np.asarray(example["labels"], dtype=TOKEN_SHARD_DTYPE)
+                index[i] = (offset, len(input_ids), len(labels))
+                offset += len(input_ids) + len(labels)
+                arrays.extend((input_ids, labels))
+            if arrays:
+                np.concatenate(arrays).tofile(f)
+
+    np.save(prefix + ".idx.npy", index)
+    with open(prefix + ".json", "w") as f:
+        json.dump({"dtype": np.dtype(TOKEN_SHARD_DTYPE).name, "num_examples": len(data), "num_tokens": offset}, f)
+
+class TokenShardDataset(torch.utils.data.Dataset):
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with open(prefix + ".json") as f:
+            self.meta = json.load(f)
+        self.index = np.load(prefix + ".idx.npy")
+        self._tokens = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return f"TokenShardDataset({self.prefix!r}, num_examples={len(self)})"
+
+    def __getstate__(self):
+        # Dataloader workers re-open the mapping instead of receiving a pickled copy of it
+        state = self.__dict__.copy()
+        state["_tokens"] = None
+        return state
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            if self.meta["num_tokens"] == 0:
+                self._tokens = np.zeros(0, dtype=self.meta["dtype"])
+            else:
+                # Copy-on-write mapping: pages are shared between processes and tensors stay writable
+                self._tokens = np.memmap(self.prefix + ".bin", dtype=self.meta["dtype"], mode="c",
+                                         shape=(self.meta["num_tokens"],))
+        return self._tokens
+
+    def source_lengths(self):
+        return self.index[:, 1]
+
+    def __getitem__(self, i):
+        start, input_length, label_length = (int(value) for value in self.index[i])
+        tokens = self.tokens
+        return {
+            "input_ids": torch.from_numpy(tokens[start:start + input_length]),
+            "labels": torch.from_numpy(tokens[start + input_length:start + input_length + label_length]),
+        }
+
+class Seq2SeqShardCollator:
+    def __init__(self, pad_token_id, label_pad_token_id=-100):
+        self.pad_token_id = pad_token_id
+        self.label_pad_token_id = label_pad_token_id
+
+    def __call__(self, batch):
+        max_input_length = max(len(example["input_ids"]) for example in batch)
+        max_label_length = max(len(example["labels"]) for example in batch)
+
+        input_ids = torch.full((len(batch), max_input_length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), max_input_length), dtype=torch.long)
+        labels = torch.full((len(batch), max_label_length), self.label_pad_token_id, dtype=torch.long)
+        for i, example in enumerate(batch):
+            input_length = len(example["input_ids"])
+            label_length = len(example["labels"])
+            input_ids[i, :input_length] = example["input_ids"]
+            attention_mask[i, :input_length] = 1
+            labels[i, :label_length] = example["labels"]
+
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
@@ -0,0 +1,193 @@
+"""T5 summary generation: batched, cached, long-document map-reduce and streaming paths."""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+
+import torch
+
+from .cache import SummaryCache
+from .instrumentation import instrumentation
+from .models import model_identity
+
+SUMMARY_PREFIX = "summarize: "
+
+def generate_summary(model, tokenizer, input_text, cache=None, stream=False):
+    if stream:
+        return generate_summary_stream(model, tokenizer, input_text)
+    return generate_summaries(model, tokenizer, [input_text], batch_size=1, cache=cache)[0]
+
+def generate_summaries(model, tokenizer, texts, batch_size=8, max_input_length=512, max_length=150, num_beams=4,
+                       length_penalty=0.8, extractive_budget=None, cache=None):
+    texts = list(texts)
+    if not texts:
+        return []
+    if cache is not None:
+        generation_settings = {"max_input_length": max_input_length, "max_length": max_length, "num_beams": num_beams,
+                               "length_penalty": length_penalty, "extractive_budget": extractive_budget}
+        keys = [cache.key(model, text, **generation_settings) for text in texts]
+        summaries = [cache.get(key) for key in keys]
+
+        # Only cache misses are generated, still in batches
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        if not missing:
+            return summaries
+        generated = generate_summaries(model, tokenizer, [texts[i] for i in missing], batch_size=batch_size,
+                                       **generation_settings)
+        for i, summary in zip(missing, generated):
+            summaries[i] = summary
+            cache.put(keys[i], summary)
+        return summaries
+
+    if extractive_budget is not None:
+        from .extractive import extractive_preselect
+
+        texts = [extractive_preselect(text, tokenizer, extractive_budget) for text in texts]
+
+    with instrumentation.timer("sentencepiece.encode_batch"):
+        encodings = tokenizer([SUMMARY_PREFIX + text for text in texts], max_length=max_input_length, truncation=True)
+    input_ids = encodings["input_ids"]
+    instrumentation.attach_model_hooks(model)
+
+    # Longest first so batches hold similar lengths and an oversized batch fails early
+    order = sorted(range(len(texts)), key=lambda i: len(input_ids[i]), reverse=True)
+
+    summaries = [None] * len(texts)
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            instrumentation.profile_step("generate")
+            batch = tokenizer.pad({"input_ids": [input_ids[i] for i in batch_indices]}, return_tensors="pt").to(model.device)
+            with instrumentation.timer("generate.batch"):
+                summary_ids = model.generate(batch["input_ids"], attention_mask=batch["attention_mask"], max_length=max_length,
+                                             length_penalty=length_penalty, num_beams=num_beams, early_stopping=True)
+            with instrumentation.timer("generate.decode"):
+                decoded = tokenizer.batch_decode(summary_ids, skip_special_tokens=True, clean_up_tokenization_spaces=True)
+            instrumentation.count("generate.documents", len(batch_indices))
+            for i, summary in zip(batch_indices, decoded):
+                summaries[i] = summary
+    return summaries
+
+def benchmark_generation_batch_sizes(model, tokenizer, texts, batch_sizes=(1, 2, 4, 8, 16), **generate_kwargs):
+    results = []
+    for batch_size in batch_sizes:
+        start_time = time.perf_counter()
+        generate_summaries(model, tokenizer, texts, batch_size=batch_size, **generate_kwargs)
+        elapsed = time.perf_counter() - start_time
+        results.append({"batch_size": batch_size, "seconds": elapsed, "docs_per_sec": len(texts) / elapsed})
+        print(f"batch_size={batch_size:3d}: {len(texts) / elapsed:.2f} docs/sec ({elapsed:.1f}s for {len(texts)} docs)")
+    return results
+
+def split_into_chunks(sentences, sentence_lengths, chunk_tokens, overlap_sentences):
+    # Windows only depend on the sentences before them, so editing the tail keeps earlier chunks identical
+    chunks = []
+    start = 0
+    while start < len(sentences):
+        end = start
+        total = 0
+        while end < len(sentences) and (end == start or total + sentence_lengths[end] <= chunk_tokens):
+            total += sentence_lengths[end]
+            end += 1
+        chunks.append(" ".join(sentences[start:end]))
+        if end == len(sentences):
+            break
+        start = max(end - overlap_sentences, start + 1)
+    return chunks
+
+def summarize_chunks(model, tokenizer, chunks, chunk_cache=None, chunk_cache_size=1024, **generate_kwargs):
+    if isinstance(chunk_cache, SummaryCache):
+        # A SummaryCache (with a SQLite tier, persistent across runs) batches its misses itself
+        return generate_summaries(model, tokenizer, chunks, cache=chunk_cache,
+                                  **{"batch_size": min(len(chunks), 8), **generate_kwargs})
+
+    cache_keys = [hashlib.sha256(json.dumps([model_identity(model), chunk, generate_kwargs], sort_keys=True).encode("utf-8")).hexdigest()
+                  for chunk in chunks]
+    if chunk_cache is None:
+        chunk_cache = OrderedDict()
+
+    missing = [i for i, key in enumerate(cache_keys) if key not in chunk_cache]
+    if missing:
+        # Uncached chunks are generated in batches of at most 8 unless the caller sets batch_size
+        generated = generate_summaries(model, tokenizer, [chunks[i] for i in missing],
+                                       **{"batch_size": min(len(missing), 8), **generate_kwargs})
+        for i, summary in zip(missing, generated):
+            chunk_cache[cache_keys[i]] = summary
+
+    summaries = []
+    for key in cache_keys:
+        chunk_cache.move_to_end(key)
+        summaries.append(chunk_cache[key])
+    while len(chunk_cache) > chunk_cache_size:
+        chunk_cache.popitem(last=False)
+    return summaries
+
+def summarize_long_document(model, tokenizer, text, chunk_tokens=480, overlap_sentences=1, reduce_depth=2,
+                            chunk_cache=None, **generate_kwargs):
+    from .preprocessing import split_sentences
+
+    current_text = text
+    for depth in range(reduce_depth + 1):
+        sentences = split_sentences(current_text)
+        sentence_lengths = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]] if sentences else []
+        # Short enough for a single pass, or out of reduce passes: summarize directly
+        if sum(sentence_lengths) <= chunk_tokens or depth == reduce_depth:
+            return generate_summaries(model, tokenizer, [current_text], **generate_kwargs)[0]
+
+        chunks = split_into_chunks(sentences, sentence_lengths, chunk_tokens, overlap_sentences)
+        partial_summaries = summarize_chunks(model, tokenizer, chunks, chunk_cache=chunk_cache, **generate_kwargs)
+        current_text = " ".join(partial_summaries)
+
+def percentile_ms(seconds, q):
+    ordered = sorted(seconds)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else None
+
+time_to_first_token = deque(maxlen=10000)
+
+def generate_summary_stream(model, tokenizer, input_text, max_input_length=512, max_length=150, do_sample=False,
+                            top_p=0.9, temperature=1.0):
+    from transformers import TextIteratorStreamer
+
+    # Streamers do not support beam search, so the interactive path decodes greedily or by sampling
+    start_time = time.perf_counter()
+    inputs = tokenizer(SUMMARY_PREFIX + input_text, max_length=max_input_length, truncation=True,
+                       return_tensors="pt").to(model.device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                    clean_up_tokenization_spaces=True)
+    generate_kwargs = dict(inputs, streamer=streamer, max_length=max_length, num_beams=1, do_sample=do_sample)
+    if do_sample:
+        generate_kwargs.update(top_p=top_p, temperature=temperature)
+
+    errors = []
+
+    def run_generate():
+        # A failed generate must still end the stream, or the consumer below waits forever
+        try:
+            with torch.inference_mode():
+                model.generate(**generate_kwargs)
+        except Exception as error:
+            errors.append(error)
+            streamer.end()
+
+    thread = threading.Thread(target=run_generate, daemon=True)
+    thread.start()
+
+    summary = ""
+    for text in streamer:
+        if not text:
+            continue
+        if not summary:
+            time_to_first_token.append(time.perf_counter() - start_time)
+        summary += text
+        yield summary
+    thread.join()
+    if errors:
+        raise errors[0]
+
+def streaming_stats():
+    return {
+        "requests": len(time_to_first_token),
+        "ttft_p50_ms": percentile_ms(time_to_first_token, 0.50),
+        "ttft_p99_ms": percentile_ms(time_to_first_token, 0.99),
+    }
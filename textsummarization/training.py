@@ -0,0 +1,319 @@
+"""Seq2seq fine-tuning of T5 on token shards with length-bucketed, token-budget batches."""
+
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from transformers import T5ForConditionalGeneration, T5Tokenizer, Trainer, TrainingArguments
+from transformers.optimization import AdamW, get_linear_schedule_with_warmup
+
+from .corpus import TokenBudgetBatches
+from .distributed import THROUGHPUT_FILE
+from .instrumentation import instrumentation
+from .models import current_rss_bytes, peak_rss_bytes
+from .shards import Seq2SeqShardCollator, TokenShardDataset
+
+class LengthBucketBatchSampler(torch.utils.data.Sampler):
+    # Groups examples of similar source length and caps each batch at max_tokens padded source tokens;
+    # with num_replicas > 1 each rank gets its own share of the batches
+    def __init__(self, source_lengths, max_tokens, shuffle=True, seed=0, num_replicas=1, rank=0):
+        self.source_lengths = np.asarray(source_lengths)
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        # The order depends on the epoch number only, so a run resumed in epoch k replays epoch k's batches and
+        # the Trainer skips exactly the ones already trained on
+        self.epoch = epoch
+
+    def _batches(self, rng):
+        # Random tie-breaking varies batch membership between epochs without changing the batch count
+        tie_break = rng.permutation(len(self.source_lengths)) if self.shuffle else np.arange(len(self.source_lengths))
+        order = np.lexsort((tie_break, self.source_lengths))
+
+        batches = []
+        batch = []
+        for index in order.tolist():
+            length = int(self.source_lengths[index])
+            # Sorted ascending, so the new example is the longest in the batch
+            if batch and length * (len(batch) + 1) > self.max_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+
+        if self.shuffle:
+            rng.shuffle(batches)
+        # Every rank shuffles with the same seed and takes every num_replicas-th batch; wrapping around pads the
+        # list so all ranks get the same count and none waits on a gradient sync the others never reach
+        if self.num_replicas > 1:
+            batches += [batches[i % len(batches)] for i in range(-len(batches) % self.num_replicas)]
+            batches = batches[self.rank::self.num_replicas]
+        return batches
+
+    def __iter__(self):
+        return iter(self._batches(np.random.RandomState(self.seed + self.epoch)))
+
+    def __len__(self):
+        return len(self._batches(np.random.RandomState(self.seed)))
+
+def activation_bytes_per_token(config, seq_len, gradient_checkpointing=False, bf16=False):
+    # Rough count of the per-token activations T5 keeps for backward: projections, attention scores and the
+    # feed-forward block of every layer, with decoder layers counted twice for cross-attention
+    element_bytes = 2 if bf16 else 4
+    per_layer = 12 * config.d_model + 2 * config.d_ff + 3 * config.num_heads * seq_len
+    num_layers = config.num_layers + 2 * config.num_decoder_layers
+    if gradient_checkpointing:
+        # Only layer inputs are kept, and one layer at a time is recomputed during backward
+        return element_bytes * (num_layers * config.d_model + 2 * per_layer)
+    return element_bytes * num_layers * per_layer
+
+def plan_micro_batches(model, max_tokens_per_batch, memory_budget_bytes, seq_len=512, gradient_checkpointing=False,
+                       bf16=False):
+    # Splits each max_tokens_per_batch batch into micro-batches that fit the budget, keeping the effective batch
+    num_params = sum(p.numel() for p in model.parameters())
+    # The loaded fp32 weights are already part of the RSS; training adds fp32 gradients and the two AdamW moments
+    fixed_bytes = current_rss_bytes() + 12 * num_params
+    per_token = activation_bytes_per_token(model.config, seq_len, gradient_checkpointing, bf16)
+    micro_tokens = (memory_budget_bytes - fixed_bytes) // per_token
+    if micro_tokens < seq_len:
+        raise ValueError(f"Memory budget of {memory_budget_bytes / 2**30:.1f} GiB cannot fit a single {seq_len}-token "
+                         f"example; enable gradient_checkpointing/bf16 or reduce max_seq_length")
+
+    gradient_accumulation_steps = -(-max_tokens_per_batch // micro_tokens)
+    micro_tokens = -(-max_tokens_per_batch // gradient_accumulation_steps)
+    print(f"Memory budget {memory_budget_bytes / 2**30:.1f} GiB: micro-batches of {micro_tokens} tokens x "
+          f"{gradient_accumulation_steps} accumulation steps")
+    return micro_tokens, gradient_accumulation_steps
+
+class EpochDataLoader(torch.utils.data.DataLoader):
+    # The Trainer calls set_epoch on its train dataloader at the start of every epoch, which a plain DataLoader
+    # lacks; passing it on keeps the batch order tied to the epoch number, also in a resumed run
+    def set_epoch(self, epoch):
+        for target in (self.batch_sampler, self.dataset):
+            if hasattr(target, "set_epoch"):
+                target.set_epoch(epoch)
+
+class BucketedSeq2SeqTrainer(Trainer):
+    def __init__(self, *args, max_tokens_per_batch=8192, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.peak_rss_history = []
+        self.samples_seen = 0
+        self._interval_peak_rss = 0
+        self._reset_throughput_counters()
+
+    def _reset_throughput_counters(self):
+        self._real_tokens = 0
+        self._padded_tokens = 0
+        self._throughput_start = None
+
+    def _bucketed_dataloader(self, dataset, shuffle):
+        # Batches are sharded across ranks here rather than by accelerator.prepare, which cannot shard batch
+        # samplers without a fixed batch size and breaks on batch_size=None loaders; the Trainer moves each
+        # batch to the device itself
+        shard_args = dict(num_replicas=self.args.world_size, rank=self.args.process_index)
+        if isinstance(dataset, torch.utils.data.IterableDataset):
+            # Streaming corpora are bucketed within a bounded window and arrive as ready-made lists of examples
+            return EpochDataLoader(
+                TokenBudgetBatches(dataset, self.max_tokens_per_batch, seed=self.args.seed, **shard_args),
+                batch_size=None,
+                collate_fn=self.data_collator,
+                num_workers=self.args.dataloader_num_workers,
+            )
+
+        batch_sampler = LengthBucketBatchSampler(dataset.source_lengths(), self.max_tokens_per_batch,
+                                                 shuffle=shuffle, seed=self.args.seed, **shard_args)
+        return EpochDataLoader(
+            dataset,
+            batch_sampler=batch_sampler,
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+        )
+
+    def get_train_dataloader(self):
+        return self._bucketed_dataloader(self.train_dataset, shuffle=True)
+
+    def get_eval_dataloader(self, eval_dataset=None):
+        return self._bucketed_dataloader(eval_dataset if eval_dataset is not None else self.eval_dataset, shuffle=False)
+
+    def training_step(self, model, inputs, *args, **kwargs):
+        if self._throughput_start is None:
+            self._throughput_start = time.perf_counter()
+        attention_mask = inputs["attention_mask"]
+        labels = inputs["labels"]
+        self._real_tokens += int(attention_mask.sum()) + int((labels != -100).sum())
+        self._padded_tokens += attention_mask.numel() + labels.numel()
+        self.samples_seen += labels.shape[0]
+        instrumentation.profile_step("train")
+        with instrumentation.timer("train.step"):
+            loss = super().training_step(model, inputs, *args, **kwargs)
+
+        # Peak RSS of this micro-batch step, including the transient activations of forward and backward
+        peak_rss = peak_rss_bytes(reset=True)
+        self.peak_rss_history.append((self.state.global_step, peak_rss))
+        self._interval_peak_rss = max(self._interval_peak_rss, peak_rss)
+        return loss
+
+    def log(self, logs, *args, **kwargs):
+        # Training logs get padding efficiency and tokens/sec for the interval since the previous log
+        if self._padded_tokens and "loss" in logs:
+            elapsed = time.perf_counter() - self._throughput_start
+            logs["padding_efficiency"] = self._real_tokens / self._padded_tokens
+            logs["tokens_per_sec"] = self._real_tokens / elapsed if elapsed > 0 else 0.0
+            logs["peak_rss_mb"] = self._interval_peak_rss / 2**20
+            self._interval_peak_rss = 0
+            self._reset_throughput_counters()
+        super().log(logs, *args, **kwargs)
+        # Hot-path timings land in ./logs/instrumentation at the same global steps as the training scalars
+        instrumentation.export(step=self.state.global_step)
+
+    def _load_optimizer_and_scheduler(self, checkpoint):
+        # Under CPU DDP args.device is "cpu:<rank>", which torch.load cannot map optimizer state onto
+        if checkpoint is None or self.args.world_size == 1 or self.args.device.type != "cpu":
+            return super()._load_optimizer_and_scheduler(checkpoint)
+        optimizer_file = os.path.join(checkpoint, "optimizer.pt")
+        scheduler_file = os.path.join(checkpoint, "scheduler.pt")
+        if os.path.isfile(optimizer_file) and os.path.isfile(scheduler_file):
+            self.optimizer.load_state_dict(torch.load(optimizer_file, map_location="cpu"))
+            self.lr_scheduler.load_state_dict(torch.load(scheduler_file))
+
+    def _save_checkpoint(self, *args, **kwargs):
+        with instrumentation.timer("checkpoint.save"):
+            return super()._save_checkpoint(*args, **kwargs)
+
+def fine_tune_T5(model_name, train_file, validation_file, test_file, output_dir, max_tokens_per_batch=8192,
+                 save_dir=None, resume_from_checkpoint=None, num_train_epochs=5, memory_budget_bytes=None,
+                 gradient_checkpointing=False, bf16=False, max_seq_length=512, max_steps=-1, save_steps=10000,
+                 save_total_limit=None):
+    # Load model and tokenizer
+    model = T5ForConditionalGeneration.from_pretrained(model_name)
+    tokenizer = T5Tokenizer.from_pretrained(model_name)
+
+    # Load training dataset; a StreamingSeq2SeqDataset streams a corpus of any size instead of a token shard
+    streaming = isinstance(train_file, torch.utils.data.IterableDataset)
+    if streaming and max_steps <= 0:
+        raise ValueError("Streaming training data has no length; pass max_steps")
+    train_dataset = train_file if streaming else TokenShardDataset(train_file)
+    validation_dataset = TokenShardDataset(validation_file)
+
+    # Load test dataset
+    test_dataset = TokenShardDataset(test_file)
+
+    # Create data collator for seq2seq batches
+    data_collator = Seq2SeqShardCollator(pad_token_id=tokenizer.pad_token_id)
+
+    # Under fine_tune_T5_distributed every process trains a replica and syncs gradients over gloo
+    world_size = int(os.environ.get("WORLD_SIZE", "1"))
+    device_args = dict(use_cpu=True, ddp_backend="gloo", ddp_find_unused_parameters=False) if world_size > 1 else {}
+
+    # A (per-process) memory budget trades batch size for accumulation steps; tokens per optimizer step stay the same
+    gradient_accumulation_steps = 1
+    if memory_budget_bytes is not None:
+        max_tokens_per_batch, gradient_accumulation_steps = plan_micro_batches(
+            model, max_tokens_per_batch, memory_budget_bytes, max_seq_length, gradient_checkpointing, bf16)
+    # bf16 autocast on CPU; the loss, optimizer state and master weights stay fp32
+    if bf16:
+        device_args.update(bf16=True, use_cpu=True)
+
+    # Define training arguments
+    training_args = TrainingArguments(
+        output_dir=output_dir,
+        num_train_epochs=num_train_epochs,
+        max_steps=max_steps,
+        # Batches are sized by max_tokens_per_batch instead of a fixed per-device batch size
+        gradient_accumulation_steps=gradient_accumulation_steps,
+        gradient_checkpointing=gradient_checkpointing,
+        warmup_steps=500,
+        weight_decay=0.01,
+        # Checkpoints every save_steps are what resume_from_checkpoint picks up after an interruption
+        save_steps=save_steps,
+        save_total_limit=save_total_limit,
+        evaluation_strategy="epoch",
+        logging_strategy="epoch",
+        logging_dir="./logs",
+        logging_steps=1000,  # Set a specific value for how often to log
+        report_to="tensorboard",  # Set the reporting backend to TensorBoard
+        **device_args,
+    )
+
+    # Create optimizer and scheduler
+    optimizer = AdamW(model.parameters(), lr=5e-5)
+    if max_steps > 0:
+        num_training_steps = max_steps
+    else:
+        # Each process steps through its own share of the bucketed batches
+        num_train_batches = -(-len(LengthBucketBatchSampler(train_dataset.source_lengths(), max_tokens_per_batch)) // world_size)
+        num_training_steps = max(1, num_train_batches // gradient_accumulation_steps) * training_args.num_train_epochs
+    scheduler = get_linear_schedule_with_warmup(optimizer, num_warmup_steps=500, num_training_steps=num_training_steps)
+
+    # Train the model
+    trainer = BucketedSeq2SeqTrainer(
+        max_tokens_per_batch=max_tokens_per_batch,
+        model=model,
+        tokenizer=tokenizer,
+        args=training_args,
+        data_collator=data_collator,
+        train_dataset=train_dataset,
+        eval_dataset=validation_dataset,
+        optimizers=(optimizer, scheduler)  # Add optimizer and scheduler to Trainer
+    )
+
+    # Fine-tune the model and save training and validation losses
+    training_losses = trainer.train(resume_from_checkpoint=resume_from_checkpoint)
+    validation_losses = trainer.evaluate()
+
+    # Replicas hold identical weights, so only the main process writes anything
+    if not trainer.is_world_process_zero():
+        return None
+
+    # Save the losses to files
+    torch.save(training_losses, "training_loss.pt")
+    torch.save(validation_losses, "validation_loss.pt")
+    torch.save(trainer.peak_rss_history, "peak_rss.pt")
+    with open("training_log_history.json", "w") as f:
+        json.dump(trainer.state.log_history, f)
+
+    # Rank 0 sees its share of the samples, about 1/world_size of the total
+    samples_per_sec = trainer.samples_seen * world_size / training_losses.metrics["train_runtime"]
+    with open(os.path.join(output_dir, THROUGHPUT_FILE), "w") as f:
+        json.dump({"world_size": world_size, "samples_per_sec": samples_per_sec}, f)
+    print(f"Training throughput: {samples_per_sec:.1f} samples/sec on {world_size} process(es)")
+
+    # Print information about the test file
+    print(f"Test file: {test_dataset}")
+
+    # Print the current working directory
+    print(f"Current working directory: {os.getcwd()}")
+
+    # Save the fine-tuned model
+    save_dir = save_dir or f"/content/gdrive/MyDrive/ATS/{output_dir}"
+    with instrumentation.timer("checkpoint.save"):
+        trainer.save_model(save_dir)
+        tokenizer.save_pretrained(save_dir)
+    return save_dir
+
+def plot_training_graph(log_history="training_log_history.json"):
+    import matplotlib.pyplot as plt
+
+    # TrainOutput only holds the final average loss; the per-epoch losses are in the Trainer's log history
+    if isinstance(log_history, str):
+        with open(log_history) as f:
+            log_history = json.load(f)
+    train_points = [(entry["epoch"], entry["loss"]) for entry in log_history if "loss" in entry]
+    val_points = [(entry["epoch"], entry["eval_loss"]) for entry in log_history if "eval_loss" in entry]
+
+    # Plot Training and Validation Loss
+    plt.plot(*zip(*train_points), label='Training Loss')
+    plt.plot(*zip(*val_points), label='Validation Loss')
+    plt.xlabel('Epoch')
+    plt.ylabel('Loss')
+    plt.legend()
+    plt.show()